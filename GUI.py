@@ -1,18 +1,52 @@
 import os
 import sys
 import pickle
-from typing import Dict
-from time import sleep
+from typing import Dict, Callable
 
 
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtGui import QPixmap
 from PyQt5.QtCore import pyqtSignal
+from loguru import logger
 
 from Ui_login import Ui_LoginWindow
 from Ui_spider import Ui_MainWindow
 
-from components import RUCSpider, SelectorManager
+from components import RUCSpider, SelectorManager, OCR_ENGINE
+from components import SESSION_CHECK_INTERVAL
+
+
+class WorkerSignals(QtCore.QObject):
+    """
+    The signals of a Worker. QRunnable is not a QObject, so it cannot hold signals itself.
+    """
+    result   = pyqtSignal(object)
+    error    = pyqtSignal(str)
+    finished = pyqtSignal()
+
+
+class Worker(QtCore.QRunnable):
+    """
+    Run a function in a thread pool, and report back to the UI thread by signals.
+    """
+    def __init__(self, function:Callable, *args, **kwargs):
+        super().__init__()
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        
+    def run(self):
+        try:
+            result = self.function(*self.args, **self.kwargs)
+        except Exception as e:
+            # The UI only gets the message, the traceback goes to the log.
+            logger.exception("{} failed in background.".format(getattr(self.function, '__name__', self.function)))
+            self.signals.error.emit(str(e))
+        else:
+            self.signals.result.emit(result)
+        finally:
+            self.signals.finished.emit()
 
 
 class LoginWindow(QtWidgets.QMainWindow, Ui_LoginWindow):
@@ -32,6 +66,7 @@ class LoginWindow(QtWidgets.QMainWindow, Ui_LoginWindow):
         # Attributes.
         self.captcha_id = ''
         self.spider = spider
+        self.thread_pool = QtCore.QThreadPool.globalInstance()
         
         # Connect functions to three buttons.
         self.LoginButton.clicked.connect(self.login)
@@ -56,11 +91,27 @@ class LoginWindow(QtWidgets.QMainWindow, Ui_LoginWindow):
         
     def get_captcha(self):
         """
-        Load a captcha and show it on the window.
+        Load a captcha in background, and show it on the window once it arrives.
         It also used as updating a new captcha.
         """
+        self.ChangeButton.setEnabled(False)
+        
+        worker = Worker(self.spider.get_captcha, manual = True)
+        worker.signals.result.connect(self.show_captcha)
+        worker.signals.finished.connect(lambda: self.ChangeButton.setEnabled(True))
+        self.thread_pool.start(worker)
+        
+    def show_captcha(self, captcha):
+        """
+        Show the captcha loaded by get_captcha.
 
-        data_img, captcha_id = self.spider.get_captcha(manual=True)
+        Args:
+            captcha (Tuple[bytes, str]): the image and the id of the captcha.
+        """
+        if captcha is None:
+            return
+        
+        data_img, captcha_id = captcha
         
         pix = QPixmap()
         pix.loadFromData(data_img)
@@ -145,6 +196,13 @@ class SpiderWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         # Set some params.
         self.spider = spider
         
+        # The network jobs run off the UI thread.
+        # Jobs touching the lecture pool share a single thread, so they never overlap.
+        self.thread_pool = QtCore.QThreadPool.globalInstance()
+        self.spider_pool = QtCore.QThreadPool()
+        self.spider_pool.setMaxThreadCount(1)
+        self.polling = False
+        
         if os.path.exists('pref.pkl'):
             with open('pref.pkl','rb') as f:
                 self.pref:Dict = pickle.load(f)
@@ -292,6 +350,7 @@ class SpiderWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         When close the window, the remained login window will be closed as well.
         it also save the information from spider, and the reference of the user.
         """
+        self.spider_pool.waitForDone()
         self.spider.save()
         self.LoginSignal.emit(True)
         
@@ -346,14 +405,25 @@ class SpiderWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         The login window will return these params back, which will used in login.
         Refer to LoginWindow.login function.
         
-        spider will use these params to try to login. After that it will try to update a cookie.
+        spider will use these params to try to login in background. After that it will try to update a cookie.
         If the login is successful, it'll emit a signal and close the login window.
         Otherwise, it'll emit a signal and show the error message box.
         """
         self.spider.set_user(user_id = user_id, passward = passward_str)
         self.spider.set_captcha(captcha_id = captcha_id, captcha = captcha_code)
         
-        session = self.spider.refresh_cookie()
+        self.login_window.LoginButton.setEnabled(False)
+        
+        worker = Worker(self.spider.login)
+        worker.signals.result.connect(self.login_finished)
+        worker.signals.error.connect(lambda message: self.login_finished(None))
+        worker.signals.finished.connect(lambda: self.login_window.LoginButton.setEnabled(True))
+        self.thread_pool.start(worker)
+        
+    def login_finished(self, session):
+        """
+        Receive the result of the login started by login.
+        """
         if session is None:
             self.LoginSignal.emit(False)
         else:
@@ -417,9 +487,7 @@ class SpiderWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.query_str = self.Query_var.text()
         
     def pause_spider(self):
-        while self.spider.locking:
-            sleep(1)
-        
+        # A poll on the way is not interrupted, its result is still counted when it arrives.
         self.update_report()
         self.timer.stop()
         self.startButton.setEnabled(True)
@@ -441,16 +509,38 @@ class SpiderWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             tSecs = self.interval % 60
         ))
         
-        if self.current_round_time == self.interval:
-            all_lec, success_lec = self.spider.check_lecture(
-                max_lecture_num = self.max_retrieve_num,
-                lecture_type = self.selectors,
-                query = self.query_str,
-            )
-            self.pull_time += 1
-            self.new_lecs += all_lec
-            self.regist_lecs += success_lec
+        if self.current_round_time == self.interval and not self.polling:
+            self.polling = True
+            
+            worker = Worker(self.spider.check_lecture,
+                            max_lecture_num = self.max_retrieve_num,
+                            lecture_type = self.selectors,
+                            query = self.query_str)
+            worker.signals.result.connect(self.poll_finished)
+            worker.signals.error.connect(self.poll_failed)
+            worker.signals.finished.connect(self.poll_done)
+            self.spider_pool.start(worker)
+            
+    def poll_finished(self, result):
+        """
+        Receive the counts of a poll, refer to RUCSpider.check_lecture.
+        """
+        all_lec, success_lec = result
         
+        self.pull_time += 1
+        self.new_lecs += all_lec
+        self.regist_lecs += success_lec
+        
+    def poll_failed(self, message:str):
+        """
+        Show the error of a poll, the next poll is still started on time.
+        """
+        logger.error("Poll failed: {}".format(message))
+        self.statusbar.showMessage("轮询失败：{}".format(message))
+        
+    def poll_done(self):
+        self.polling = False
+
 
     def update_report(self):
         self.update_process()
@@ -466,7 +556,10 @@ class SpiderWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         )
         
         if self.total_time % 3600 == 0:
-            self.spider.clear_pool()
+            self.spider_pool.start(Worker(self.spider.clear_pool))
+            
+        if self.total_time % SESSION_CHECK_INTERVAL == 0:
+            self.spider.keep_session()
     # Report part methods ends.
     
     
@@ -474,6 +567,7 @@ class SpiderWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
 if __name__ == '__main__':
 
+    OCR_ENGINE.preload()
     spider = RUCSpider()
     app = QtWidgets.QApplication((sys.argv))
     window = SpiderWindow(spider)
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+from typing import List, Union
+
+DAYS_PER_WEEK = 7
+HOURS_PER_DAY = 24
+
+MIN_INTERVAL = 10
+MAX_INTERVAL = 600
+MIN_OBSERVATIONS = 5
+DECAY = 0.99
+
+
+class PublicationHistogram(object):
+    '''
+    When new lectures show up, counted by day of week and hour of day.
+
+    It is saved with the spider, so what is learned carries over runs.
+    Older observations decay a bit at each new one, so a changed release habit is picked up.
+    '''
+
+    def __init__(self, decay:float = DECAY):
+        self.decay = decay
+        self.counts:List[List[float]] = [[0.0] * HOURS_PER_DAY for _ in range(DAYS_PER_WEEK)]
+        self.observations:int = 0
+
+    def __repr__(self) -> str:
+        return f'PublicationHistogram with {self.observations} observation(s)'
+
+    def record(self, count:int = 1, moment:datetime = None):
+        """
+        Record `count` new lectures seen at `moment`.
+        """
+        if count <= 0:
+            return
+
+        if moment is None:
+            moment = datetime.now()
+
+        for day in self.counts:
+            for hour in range(HOURS_PER_DAY):
+                day[hour] *= self.decay
+
+        self.counts[moment.weekday()][moment.hour] += count
+        self.observations += count
+
+    def count_at(self, moment:datetime) -> float:
+        return self.counts[moment.weekday()][moment.hour]
+
+    def activity(self, moment:datetime = None) -> Union[float, None]:
+        """
+        How likely lectures are published around `moment`, from 0 (never seen) to 1 (the busiest hour).
+        The next hour is looked at as well, so the polling speeds up before a release window begins.
+
+        Returns:
+            float | None: None if too few lectures have been observed to tell.
+        """
+        if self.observations < MIN_OBSERVATIONS:
+            return None
+
+        if moment is None:
+            moment = datetime.now()
+
+        busiest = max(max(day) for day in self.counts)
+        if busiest <= 0:
+            return None
+
+        around = max(self.count_at(moment), self.count_at(moment + timedelta(hours = 1)))
+        return around / busiest
+
+
+class AdaptiveInterval(object):
+    '''
+    The polling interval learned from a PublicationHistogram.
+
+    It goes down to min_interval around the usual release windows, and up to max_interval in quiet hours.
+    Until enough lectures are observed, the base interval is used.
+    '''
+
+    def __init__(self,
+                histogram    : PublicationHistogram,
+                base_interval: float = 120,
+                min_interval : float = MIN_INTERVAL,
+                max_interval : float = MAX_INTERVAL):
+        """
+        Args:
+            histogram (PublicationHistogram): The observed publications.
+            base_interval (float, optional): The seconds between polls before enough is learned. Defaults to 120.
+            min_interval (float, optional): The fastest polling allowed. Defaults to MIN_INTERVAL.
+            max_interval (float, optional): The slowest polling allowed. Defaults to MAX_INTERVAL.
+        """
+        assert 0 < min_interval <= max_interval, "min_interval should be positive and not greater than max_interval"
+
+        self.histogram = histogram
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+    def next_interval(self, moment:datetime = None) -> float:
+        activity = self.histogram.activity(moment)
+
+        if activity is None:
+            return min(max(self.base_interval, self.min_interval), self.max_interval)
+
+        # Interpolate on a log scale, so a moderately busy hour already polls a lot faster.
+        return self.max_interval * (self.min_interval / self.max_interval) ** activity
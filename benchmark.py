@@ -0,0 +1,484 @@
+"""
+Benchmarks for the spider. Run them with `python benchmark.py <name>`.
+
+Nothing here touches the real server, the network parts are served by mock_server.MockCampus.
+"""
+import io
+import os
+import sys
+import json
+import random
+import time
+import subprocess
+import tempfile
+import threading
+import statistics
+import multiprocessing
+from datetime import datetime
+import tracemalloc
+from typing import Dict, Callable
+
+from components import RUCSpider, OcrEngine, OCR_ENGINE
+from mock_server import MockCampus, make_spider
+from orchestrator import Orchestrator
+from priority import DEFAULT_RULES
+from lecture import parse_lectures
+
+
+def bench_idle_cpu(duration_seconds: float = 10.0) -> Dict[str, float]:
+    """
+    Run the spider with nothing due for the whole duration, and measure how much CPU it burns.
+
+    Args:
+        duration_seconds (float, optional): How long the spider idles. Defaults to 10.0.
+
+    Returns:
+        Dict[str, float]: The wall time, the CPU time and the CPU usage in percent.
+    """
+    spider = RUCSpider(load_path = None)
+
+    runner = threading.Thread(target = spider.run,
+                            kwargs = {'checking_interval_seconds': 3600},
+                            daemon = True)
+
+    cpu_begin  = time.process_time()
+    wall_begin = time.perf_counter()
+
+    runner.start()
+    time.sleep(duration_seconds)
+    spider.stop()
+    runner.join()
+
+    cpu_time  = time.process_time() - cpu_begin
+    wall_time = time.perf_counter() - wall_begin
+
+    return {'wall_seconds': wall_time,
+            'cpu_seconds' : cpu_time,
+            'cpu_percent' : cpu_time / wall_time * 100}
+
+
+STARTUP_SCRIPTS: Dict[str, str] = {
+    # What main.py and GUI.py do before waiting for the user, without the prompt and the window.
+    'main': 'from components import RUCSpider; RUCSpider(load_path = None)',
+    'gui' : 'import GUI; from components import RUCSpider; RUCSpider(load_path = None)'
+}
+
+
+def bench_startup(rounds: int = 3, top: int = 3) -> Dict[str, float]:
+    """
+    Start a fresh interpreter for each entry point, and measure how long it takes until the spider is built.
+
+    Args:
+        rounds (int, optional): The number of starts to average. Defaults to 3.
+        top (int, optional): The number of the heaviest imports reported. Defaults to 3.
+
+    Returns:
+        Dict[str, float]: The startup time of each entry point, and its heaviest top level imports, in milliseconds.
+    """
+    result = {}
+
+    for name, script in STARTUP_SCRIPTS.items():
+        seconds = []
+
+        for _ in range(rounds):
+            begin = time.perf_counter()
+            process = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                                    cwd            = os.path.dirname(os.path.abspath(__file__)),
+                                    capture_output = True,
+                                    text           = True,
+                                    check          = True)
+            seconds.append(time.perf_counter() - begin)
+
+        # Each line is 'import time: self | cumulative | module', the module indented by two spaces a level.
+        # The modules one level down are the ones imported by the entry point itself.
+        imports = {}
+        for line in process.stderr.splitlines()[1:]:
+            _, cumulative, module = line.split('|')
+            if module.startswith('   ') and not module.startswith('     '):
+                imports[module.strip()] = int(cumulative) / 1000
+
+        result[f'{name}_ms'] = statistics.mean(seconds) * 1000
+        for module, cost in sorted(imports.items(), key = lambda item: item[1], reverse = True)[:top]:
+            result[f'{name}_import_{module}_ms'] = cost
+
+    return result
+
+
+def make_captcha_image(text: str = 'a3Kx') -> bytes:
+    """
+    Draw a captcha-like png, close enough in size to what the server sends.
+    """
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', (120, 40), 'white')
+    ImageDraw.Draw(image).text((30, 12), text, fill = 'black')
+
+    buffer = io.BytesIO()
+    image.save(buffer, format = 'PNG')
+    return buffer.getvalue()
+
+
+def bench_ocr(warm_rounds: int = 20) -> Dict[str, float]:
+    """
+    Compare the first recognition, which loads the model, with the following ones.
+
+    Args:
+        warm_rounds (int, optional): The number of warm recognitions to average. Defaults to 20.
+
+    Returns:
+        Dict[str, float]: The cold and the mean warm latency in milliseconds.
+    """
+    image  = make_captcha_image()
+    engine = OcrEngine()
+
+    begin = time.perf_counter()
+    engine.classification(image)
+    cold = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    for _ in range(warm_rounds):
+        engine.classification(image)
+    warm = (time.perf_counter() - begin) / warm_rounds
+
+    return {'cold_ms': cold * 1000,
+            'warm_ms': warm * 1000}
+
+
+def bench_e2e(duration_seconds: float = 10.0,
+                poll_interval   : float = 0.5,
+                latency         : float = 0.02,
+                error_rate      : float = 0.0,
+                lecture_count   : int   = 8) -> Dict[str, float]:
+    """
+    Poll the mock campus while it publishes lectures, and measure the way from search to registration.
+
+    Args:
+        duration_seconds (float, optional): How long the spider polls. Defaults to 10.0.
+        poll_interval (float, optional): The seconds between two polls. Defaults to 0.5.
+        latency (float, optional): The latency of each response of the mock. Defaults to 0.02.
+        error_rate (float, optional): The chance of a 503 from the mock. Defaults to 0.0.
+        lecture_count (int, optional): The number of lectures published during the run. Defaults to 8.
+
+    Returns:
+        Dict[str, float]: The poll-to-registration latency, requests per poll, and poll throughput.
+    """
+    campus = MockCampus(latency = latency, error_rate = error_rate)
+    campus.publish_every(duration_seconds / (lecture_count + 1), count = lecture_count, first = 0.5)
+    campus.start()
+
+    spider = make_spider(campus.base_url)
+    campus.requests.clear()
+
+    polls = 0
+    poll_seconds = []
+    end = time.perf_counter() + duration_seconds
+
+    while time.perf_counter() < end:
+        begin = time.perf_counter()
+        spider.check_lecture(max_lecture_num = 10)
+        poll_seconds.append(time.perf_counter() - begin)
+        polls += 1
+
+        time.sleep(max(poll_interval - poll_seconds[-1], 0))
+
+    campus.stop()
+
+    latencies = list(campus.registration_latencies().values()) or [0.0]
+    attempts = sum(len(times) for times in campus.registrations.values())
+
+    return {'polls'                  : polls,
+            'polls_skipped'          : spider.polls_skipped,
+            'requests_per_poll'      : sum(campus.requests.values()) / polls,
+            'polls_per_second'       : polls / sum(poll_seconds) if sum(poll_seconds) > 0 else 0.0,
+            'registered'             : len(campus.registrations),
+            'duplicate_registrations': attempts - len(campus.registrations),
+            'latency_mean_ms'        : statistics.mean(latencies) * 1000,
+            'latency_max_ms'         : max(latencies) * 1000}
+
+
+def bench_snipe(opens_in: float = 3.0, lecture_count: int = 3, latency: float = 0.02) -> Dict[str, float]:
+    """
+    Publish lectures opening in the future, and measure how close to the opening the sniper registers them.
+
+    Args:
+        opens_in (float, optional): The seconds from now the lectures open. Defaults to 3.0.
+        lecture_count (int, optional): The number of lectures. Defaults to 3.
+        latency (float, optional): The latency of each response of the mock. Defaults to 0.02.
+
+    Returns:
+        Dict[str, float]: The offset of the attempts from the opening, and the attempts refused as too early.
+    """
+    campus = MockCampus(latency = latency)
+    for _ in range(lecture_count):
+        campus.publish(0, campus.make_lecture(opens_in = opens_in))
+    campus.start()
+
+    spider = make_spider(campus.base_url)
+    spider.enable_snipe(warmup = 1, lead = latency)
+    spider.check_lecture(max_lecture_num = 10)
+
+    # The opening is whole seconds, wait for the full second after it.
+    time.sleep(opens_in + 2)
+    spider.stop()
+    campus.stop()
+
+    reports = spider.sniper.reports or [{'offset_ms': 0.0}]
+    first = [report['offset_ms'] for report in reports if report.get('attempt') == 1] or [0.0]
+
+    return {'registered'        : len(campus.registrations),
+            'attempts'          : len(spider.sniper.reports),
+            'early_attempts'    : sum(campus.early.values()),
+            'first_offset_ms'   : statistics.mean(first),
+            'max_offset_ms'     : max(report['offset_ms'] for report in reports)}
+
+
+def bench_priority(lecture_count: int = 20, urgent_count: int = 5, concurrency: int = 2, latency: float = 0.02) -> Dict[str, float]:
+    """
+    Publish many lectures at once, and measure when the ones closing first are registered,
+    in the order they are found against the order of the registration queue.
+
+    Args:
+        lecture_count (int, optional): The number of lectures published. Defaults to 20.
+        urgent_count (int, optional): The number of lectures closing first to follow. Defaults to 5.
+        concurrency (int, optional): The max number of registrations on the fly. Defaults to 2.
+        latency (float, optional): The latency of each response of the mock. Defaults to 0.02.
+
+    Returns:
+        Dict[str, float]: The mean and the last position in the registrations of the urgent lectures, for both orders.
+    """
+    generator = random.Random(0)
+    maker = MockCampus()
+    lectures = [maker.make_lecture(regist_seconds = generator.randint(600, 86400)) for _ in range(lecture_count)]
+    maker.server.server_close()
+
+    for lecture in lectures:
+        lecture['registnum'] = generator.randint(0, 99)
+
+    urgent = {str(lecture['aid']) for lecture in sorted(lectures, key = lambda lecture: lecture['registendtime'])[:urgent_count]}
+    result = {}
+
+    for name, rules in (('found', ()), ('queued', DEFAULT_RULES)):
+        campus = MockCampus(latency = latency)
+        for lecture in lectures:
+            campus.publish(0.0, dict(lecture))
+        campus.start()
+
+        spider = make_spider(campus.base_url)
+        spider.registration_rules = rules
+        spider.check_lecture(max_lecture_num = lecture_count, concurrency = concurrency)
+        campus.stop()
+
+        order = sorted(campus.registrations, key = lambda aid: campus.registrations[aid][0])
+        positions = [order.index(aid) for aid in urgent]
+
+        result[f'{name}_urgent_mean_position'] = statistics.mean(positions)
+        result[f'{name}_urgent_last_position'] = max(positions)
+
+    return result
+
+
+def make_search_payload(lecture_count: int) -> bytes:
+    """
+    A search response as large as the real ones get, each lecture with the dozen fields the server sends.
+    """
+    campus = MockCampus()
+    lectures = []
+
+    for _ in range(lecture_count):
+        lecture = campus.make_lecture()
+        lecture.update({'typelevel1'   : 95,
+                        'typelevel2'   : 22,
+                        'typelevel3'   : 108,
+                        'location'     : '明德主楼 0101',
+                        'owneruid'     : 'u' * 16,
+                        'sponsordeptid': 42,
+                        'progress'     : 1,
+                        'begintime'    : lecture['registendtime'],
+                        'endtime'      : lecture['registendtime'],
+                        'description'  : '讲座简介' * 50})
+        lectures.append(lecture)
+
+    campus.server.server_close()
+    return json.dumps({'data': {'data': lectures}}, ensure_ascii = False).encode('utf-8')
+
+
+def parse_raw(body: bytes):
+    """
+    The parsing before Lecture: the raw dicts, each end time parsed twice and each lecture dumped for its fingerprint.
+    """
+    lectures = json.loads(body)['data']['data']
+
+    for lecture in lectures:
+        datetime.strptime(lecture['registendtime'], '%Y-%m-%d %H:%M:%S')
+        datetime.strptime(lecture['registendtime'], '%Y-%m-%d %H:%M:%S')
+        hash(json.dumps(lecture, sort_keys = True))
+
+    return lectures
+
+
+def bench_parse(lecture_count: int = 1000, rounds: int = 20) -> Dict[str, float]:
+    """
+    Compare parsing a large search response into raw dicts, as before, with parsing it into Lecture records,
+    and into Lecture records keeping the raw dicts, as for a custom filter.
+
+    Args:
+        lecture_count (int, optional): The number of lectures in the response. Defaults to 1000.
+        rounds (int, optional): The number of parses to average. Defaults to 20.
+
+    Returns:
+        Dict[str, float]: The CPU time and the memory kept per lecture, for each way.
+    """
+    body = make_search_payload(lecture_count)
+    result = {'payload_kb': len(body) / 1024}
+
+    parsers = (('raw'        , parse_raw),
+                ('lecture'    , parse_lectures),
+                ('lecture_raw', lambda body: parse_lectures(body, keep_raw = True)))
+
+    for name, parse in parsers:
+        begin = time.process_time()
+        for _ in range(rounds):
+            parse(body)
+        cpu = (time.process_time() - begin) / rounds
+
+        tracemalloc.start()
+        lectures = parse(body)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del lectures
+
+        result[f'{name}_cpu_us_per_lecture'] = cpu / lecture_count * 1e6
+        result[f'{name}_bytes_per_lecture'] = memory / lecture_count
+
+    return result
+
+
+def serve_large_page(lecture_count: int, bandwidth: float, urls: multiprocessing.Queue, stop: multiprocessing.Event):
+    """
+    Serve a mock campus with one large page until `stop` is set, putting its base url to `urls`.
+    Run in a child process, so the memory of the server stays out of the spider's.
+    """
+    campus = MockCampus(bandwidth = bandwidth)
+    for _ in range(lecture_count):
+        lecture = campus.make_lecture()
+        lecture['description'] = '讲座简介' * 50
+        campus.publish(0.0, lecture)
+    campus.start()
+
+    urls.put(campus.base_url)
+    stop.wait()
+    campus.stop()
+
+
+def bench_stream(lecture_count: int = 500, bandwidth: float = 512 * 1024) -> Dict[str, float]:
+    """
+    Search a large page over a slow link, and measure when the first and the last lecture come out,
+    with the page decoded after its last byte and while it downloads.
+    The mock runs in a child process, so the peak memory is the spider's alone.
+
+    Args:
+        lecture_count (int, optional): The number of lectures on the page. Defaults to 500.
+        bandwidth (float, optional): The bytes per second the mock sends. Defaults to 512 KB/s.
+
+    Returns:
+        Dict[str, float]: The times to the first and the last lecture, and the peak memory of the search, for both ways.
+    """
+    urls = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    server = multiprocessing.Process(target = serve_large_page, args = (lecture_count, bandwidth, urls, stop), daemon = True)
+    server.start()
+    base_url = urls.get(timeout = 30)
+
+    result = {}
+
+    for name, stream in (('buffered', False), ('stream', True)):
+        spider = make_spider(base_url)
+
+        tracemalloc.start()
+        begin = time.perf_counter()
+        first = None
+
+        for _ in spider.search_lectures(perpage = lecture_count, max_pages = 1, incremental = False, stream = stream):
+            if first is None:
+                first = time.perf_counter() - begin
+
+        last = time.perf_counter() - begin
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        result[f'{name}_first_ms'] = first * 1000
+        result[f'{name}_last_ms'] = last * 1000
+        result[f'{name}_peak_kb'] = peak / 1024
+
+    stop.set()
+    server.join()
+    return result
+
+
+def bench_accounts(account_count: int = 10, duration_seconds: float = 10.0) -> Dict[str, float]:
+    """
+    Host many accounts in one orchestrator polling the mock campus, and measure the cost of each account.
+
+    Args:
+        account_count (int, optional): The number of accounts. Defaults to 10.
+        duration_seconds (float, optional): How long the accounts poll. Defaults to 10.0.
+
+    Returns:
+        Dict[str, float]: The memory and the CPU usage per account.
+    """
+    campus = MockCampus()
+    campus.publish_every(1, count = 5)
+    campus.start()
+
+    # The shared OCR engine is loaded once for the process, keep it out of the per account cost.
+    OCR_ENGINE.load()
+
+    with tempfile.TemporaryDirectory() as state_dir:
+        orchestrator = Orchestrator(state_dir = state_dir, base_url = campus.base_url)
+
+        tracemalloc.start()
+        memory_begin = tracemalloc.get_traced_memory()[0]
+
+        for index in range(account_count):
+            spider = orchestrator.add_account(f'bench{index}', 'bench', checking_interval_seconds = 1)
+            spider.set_captcha('bench', 'bench')
+
+        memory = tracemalloc.get_traced_memory()[0] - memory_begin
+        tracemalloc.stop()
+
+        runner = threading.Thread(target = orchestrator.run, daemon = True)
+
+        cpu_begin = time.process_time()
+        runner.start()
+        time.sleep(duration_seconds)
+        orchestrator.stop()
+        runner.join()
+        cpu_time = time.process_time() - cpu_begin
+
+    campus.stop()
+
+    return {'accounts'              : account_count,
+            'memory_kb_per_account' : memory / account_count / 1024,
+            'cpu_percent_per_account': cpu_time / duration_seconds * 100 / account_count,
+            'registered'            : sum(len(times) for times in campus.registrations.values())}
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    'startup'  : bench_startup,
+    'idle_cpu' : bench_idle_cpu,
+    'ocr'      : bench_ocr,
+    'e2e'      : bench_e2e,
+    'snipe'    : bench_snipe,
+    'priority' : bench_priority,
+    'parse'    : bench_parse,
+    'stream'   : bench_stream,
+    'accounts' : bench_accounts
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS.keys())
+
+    for name in names:
+        result = BENCHMARKS[name]()
+        print(name, ' '.join(f'{key}={value:.4f}' for key, value in result.items()))
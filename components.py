@@ -4,23 +4,74 @@ import re
 import sys
 import json
 import base64
+import random
 import pickle
-import atexit
-from typing import Literal, Dict, Any, Union, List, Callable, Set, Tuple
+import heapq
+import queue
+import itertools
+import contextvars
+import hashlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Literal, Dict, Any, Union, List, Callable, Set, Tuple, Iterable, Iterator
 
 import requests
 import schedule
 from loguru import logger
-from fake_useragent import UserAgent
 from datetime import datetime, timedelta
 
-from tenacity import retry, stop_after_attempt, wait_fixed,retry_if_exception
+from requests.adapters import HTTPAdapter
+from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception, retry_if_exception_type
+from tenacity import Retrying
 
 from constants import ALIAS, LOGGER_FORMAT, NOTIFIER
 from constants import SELECTORS
 from constants import Methods
 
+from adaptive import PublicationHistogram, AdaptiveInterval
+from adaptive import MIN_INTERVAL, MAX_INTERVAL
+from sniper import Sniper, is_not_open
+from store import StateStore, store_path, MEMORY
+from metrics import METRICS
+from hooks import HOOKS, RequestInfo
+from tracing import TRACER
+from resilience import RETRY_BUDGET, BREAKER, RETRY_STATUSES, policy_for, budget_spent
+from ratelimit import LIMITER, priority_for
+from lecture import Lecture, parse_lectures, stream_lectures, normalize_aid
+from priority import RegistrationQueue, DEFAULT_RULES, check_rules
+
+BASE_URL = 'https://v.ruc.edu.cn'
 COOKIE_VALID_TIME = 18000
+COOKIE_REFRESH_AHEAD = 600
+SESSION_CHECK_INTERVAL = 60
+LOGIN_URL_MARK = '/auth/login'
+# An auth error may also come as a 200 with a small json body, e.g. {"code": 401, "msg": "未登录"}.
+AUTH_ERROR_CODES = (401, 403, '401', '403')
+AUTH_ERROR_MESSAGES = ('未登录', '请先登录', '登录已过期', '登录失效', '会话已过期')
+AUTH_ERROR_TYPES = ('invalid_token', 'unauthorized', 'access_denied')
+AUTH_ERROR_MAX_BYTES = 1024
+POOL_SIZE = 10
+REGIST_CONCURRENCY = 5
+MAX_PAGES = 5
+PAGE_CONCURRENCY = 3
+STREAM_CHUNK_SIZE = 1024
+STREAM_QUEUE_SIZE = 16
+CAPTCHA_POOL_SIZE = 2
+CAPTCHA_MAX_AGE = 120
+UA_CACHE_PATH = './user_agents.json'
+UA_POOL_SIZE = 50
+
+TOKEN_REGEX = re.compile(r'(?<=<input type="hidden" name="csrftoken" value=")([\S]+)(?=" id="csrftoken" \/>)')
+CAPTCHA_REGEX = re.compile(r"(?<=data:image\/png;base64,)([\S]+)")
+
+FALLBACK_USER_AGENTS = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36 Edg/122.0.0.0',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:123.0) Gecko/20100101 Firefox/123.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.3 Safari/605.1.15',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36')
 
 logger.remove(handler_id = None)
 
@@ -29,40 +80,106 @@ logger.add(sys.stderr,
             diagnose  = True,
             backtrace = True)
 
+def send_request(method:Literal['GET', 'POST'], sender, **kwargs) -> requests.Response:
+    """
+    Send a single request through the rate limiter and the hooks. 
+    A response of RETRY_STATUSES raises, so it is retried as a failure.
+    """
+    LIMITER.acquire(priority_for(kwargs.get('url', '')))
+    
+    info = RequestInfo(method, kwargs)
+    HOOKS.emit('before_request', info)
+    
+    try:
+        if method == 'GET':
+            response:requests.Response = sender.get(**info.kwargs)
+        elif method == 'POST':
+            response:requests.Response = sender.post(**info.kwargs)
+        else:
+            raise ValueError(f"method {method} is not supported")
+    except Exception as e:
+        info.finish(error = e)
+        HOOKS.emit('on_error', info, e)
+        raise
+    
+    info.finish(response)
+    HOOKS.emit('after_response', info, response)
+    
+    if response.status_code in RETRY_STATUSES:
+        raise requests.exceptions.HTTPError(f"{response.status_code} from {info.endpoint}", response = response)
+    
+    return response
+
+def count_retry(retry_state):
+    METRICS.increment('retries')
+    HOOKS.retry_callback(retry_state)
+
 @logger.catch
-@retry(stop = stop_after_attempt(3), 
-        wait = wait_fixed(1), 
-        retry_error_callback = lambda rs: print(rs.outcome.result()),
-        retry = retry_if_exception(requests.exceptions.RequestException),
-        reraise = True)
-def query_html(method        : Literal['GET', 'POST']            = 'GET',
-                output_format: Literal['text','json','response'] = 'json',
-                encoding     : str                               = 'utf-8',
+def query_html(method        : Literal['GET', 'POST']                     = 'GET',
+                output_format: Literal['text','json','response','stream'] = 'json',
+                encoding     : str                                        = 'utf-8',
+                session      : requests.Session                           = None,
                 **kwargs) -> Union [str , Dict[str,str], requests.Response]: 
     """
     This function is used as the base function to query the html.
+    
+    The request waits for its turn in the rate limiter shared by the process, refer to ratelimit.
+    It is retried by the policy of its endpoint, with jittered exponential waits, 
+    as long as the process-wide retry budget allows. While the circuit breaker is open, 
+    only the critical endpoints (registration and login) are requested. Refer to resilience.
 
     Args:
         method (Literal[GET|POST], optional): The method of the server. Defaults to 'GET'.
         is_json (bool, optional): the expected result is a json or not. Defaults to True.
         vervose (bool, optional): whether to output some middle information. Defaults to False.
         encoding (str, optional): The encoding of the website. Defaults to 'utf-8'.
+        session (requests.Session, optional): The pooled client to send the request with.
+            Defaults to None, which falls back to the module-level requests functions.
+        output_format (Literal[text|json|response|stream], optional): 'stream' returns the response 
+            as soon as its headers arrive, with the body left to read, e.g. by lecture.stream_lectures.
+            The caller should read it through or close it, so the connection goes back to the pool. Defaults to 'json'.
         
         **kwargs: The parameters of the request. use this as origin requests function.
+            The hooks of hooks.HOOKS are called around the request, and may change them.
         
     Returns:
         str | Dict[str,str]: The result of the request.
         if is_json is set as true, then returns a dict, else returns a str.
+        None if the request still fails after its retries, or is held back by the circuit breaker.
         
     >>> query_html('GET', 'text', url='https://www.baidu.com', headers = headers)
     """
     
-    if method == 'GET':
-        response:requests.Response = requests.get(**kwargs)
-    elif method == 'POST':
-        response:requests.Response = requests.post(**kwargs)
-    else:
-        raise ValueError(f"method {method} is not supported")
+    sender = requests if session is None else session
+    policy = policy_for(kwargs.get('url', ''))
+    
+    if not BREAKER.allow(policy.critical):
+        METRICS.increment('requests_short_circuited')
+        return None
+    
+    RETRY_BUDGET.record_request()
+    
+    if output_format == 'stream':
+        kwargs['stream'] = True
+    
+    retrying = Retrying(stop         = stop_after_attempt(policy.attempts) | budget_spent,
+                        wait         = lambda retry_state: policy.wait(retry_state.attempt_number),
+                        retry        = retry_if_exception_type(requests.exceptions.RequestException),
+                        before_sleep = count_retry,
+                        reraise      = True)
+    
+    try:
+        response:requests.Response = retrying(send_request, method = method, sender = sender, **kwargs)
+    except requests.exceptions.RequestException as e:
+        BREAKER.record_failure()
+        logger.warning("{} {} failed: {}".format(method, kwargs.get('url', ''), e))
+        return None
+    except Exception:
+        # Any other failure still ends a probe of the breaker, or it would stay half open for good.
+        BREAKER.record_failure()
+        raise
+    
+    BREAKER.record_success()
     
     response.encoding = encoding
     
@@ -70,11 +187,202 @@ def query_html(method        : Literal['GET', 'POST']            = 'GET',
         return response.json()
     elif output_format == 'text':
         return response.text
-    elif output_format == 'response':
+    elif output_format in ('response', 'stream'):
         return response
     else:
         raise ValueError(f"output_format {output_format} is not supported")
 
+def read_ahead(response:requests.Response, size:int) -> bool:
+    """
+    Read the first `size` bytes of a streamed body, whatever its headers say, and leave them to iter_content.
+    
+    Returns:
+        bool: whether the whole body was read, then it is response.content as well.
+    """
+    chunks = response.iter_content(STREAM_CHUNK_SIZE)
+    head:List[bytes] = []
+    length = 0
+    
+    for chunk in chunks:
+        head.append(chunk)
+        length += len(chunk)
+        if length > size:
+            break
+    else:
+        # Read through, requests serves content and iter_content from it.
+        response._content = b''.join(head)
+        return True
+    
+    response.iter_content = lambda chunk_size = 1, decode_unicode = False: itertools.chain(head, chunks)
+    return False
+
+def create_client(pool_size: int = POOL_SIZE, adapter: HTTPAdapter = None) -> requests.Session:
+    """
+    Build a keep-alive client with a connection pool, so the requests to the server
+    reuse the established TCP/TLS connections instead of handshaking every time.
+
+    Args:
+        pool_size (int, optional): The max number of kept connections per host. Defaults to POOL_SIZE.
+        adapter (HTTPAdapter, optional): The connection pool to use, which can be shared by several clients. 
+            Defaults to None, which builds a new one of pool_size.
+
+    Returns:
+        requests.Session: The pooled client, which also holds the cookie jar.
+    """
+    client = requests.Session()
+    if adapter is None:
+        adapter = HTTPAdapter(pool_connections = pool_size,
+                            pool_maxsize     = pool_size)
+    client.mount('https://', adapter)
+    client.mount('http://', adapter)
+    client.headers.update({'Connection': 'keep-alive'})
+    
+    return client
+
+def serve_scheduler(scheduler: schedule.Scheduler, wake_event: threading.Event, is_running: Callable[[], bool]):
+    """
+    Run the jobs of the scheduler as they get due, and sleep in between.
+
+    Args:
+        scheduler (schedule.Scheduler): The scheduler holding the jobs.
+        wake_event (threading.Event): Set it to interrupt the sleep, e.g. to stop or after the jobs are changed.
+        is_running (Callable[[], bool]): The loop goes on while it returns True.
+    """
+    while is_running():
+        scheduler.run_pending()
+        
+        # Sleep until the next job is due, unless someone wakes us up earlier.
+        idle_seconds = scheduler.idle_seconds
+        if idle_seconds is not None:
+            idle_seconds = max(idle_seconds, 0)
+        
+        wake_event.wait(idle_seconds)
+        wake_event.clear()
+
+def is_not_end(lecture: Lecture) -> bool:
+    """
+    The default filter, which keeps the lectures still open for registration.
+    """
+    return lecture.regist_end is not None and lecture.regist_end > datetime.now()
+
+class OcrEngine(object):
+    '''
+    The captcha recognizer shared by the whole process.
+    
+    Loading the model of ddddocr takes seconds, so it is loaded only once and reused by every spider.
+    The recognition is guarded by a lock, so the spiders can share it from different threads.
+    '''
+    
+    def __init__(self):
+        self.ocr = None
+        self.load_lock = threading.Lock()
+        self.run_lock = threading.Lock()
+        
+    def is_loaded(self) -> bool:
+        return self.ocr is not None
+        
+    def load(self):
+        if self.ocr is not None:
+            return self.ocr
+        
+        with self.load_lock:
+            if self.ocr is None:
+                from ddddocr import DdddOcr
+                self.ocr = DdddOcr(show_ad = False)
+                logger.info("OCR engine loaded.")
+        
+        return self.ocr
+    
+    def preload(self, background:bool = True):
+        """
+        Load the model ahead of the first captcha.
+
+        Args:
+            background (bool, optional): load in a daemon thread, so the startup is not blocked. Defaults to True.
+        """
+        if background:
+            threading.Thread(target = self.load, daemon = True).start()
+        else:
+            self.load()
+    
+    def classification(self, image:bytes) -> str:
+        ocr = self.load()
+        
+        with self.run_lock:
+            return ocr.classification(image)
+
+OCR_ENGINE = OcrEngine()
+
+class UserAgentPool(object):
+    '''
+    A fixed set of desktop user agents shared by the whole process.
+    
+    Building the fake_useragent dataset takes a third of a second and about 10 MB,
+    so it is only done once to fill the cache file, and later runs read the few lines there.
+    Without the cache and fake_useragent, FALLBACK_USER_AGENTS are used, so it always works offline.
+    '''
+    
+    def __init__(self, cache_path:str = UA_CACHE_PATH, size:int = UA_POOL_SIZE):
+        """
+        Args:
+            cache_path (str, optional): The json file holding the pool. Defaults to UA_CACHE_PATH.
+            size (int, optional): The number of user agents drawn from fake_useragent. Defaults to UA_POOL_SIZE.
+        """
+        self.cache_path = cache_path
+        self.size = size
+        self.user_agents:List[str] = None
+        self.load_lock = threading.Lock()
+        
+    def __len__(self) -> int:
+        return len(self.load())
+        
+    def load(self) -> List[str]:
+        if self.user_agents is not None:
+            return self.user_agents
+        
+        with self.load_lock:
+            if self.user_agents is None:
+                self.user_agents = self.read_cache() or self.build()
+        
+        return self.user_agents
+    
+    def read_cache(self) -> List[str]:
+        try:
+            with open(self.cache_path, 'r', encoding = 'utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+    
+    def build(self) -> List[str]:
+        try:
+            from fake_useragent import UserAgent
+            ua = UserAgent(browsers = ['Chrome', 'Edge', 'Firefox', 'Safari'], os = ['Windows', 'Mac OS X'])
+            user_agents = sorted({ua.random for _ in range(self.size * 4)})[:self.size]
+        except Exception:
+            logger.warning("fake_useragent is not available, using the built-in user agents.")
+            return list(FALLBACK_USER_AGENTS)
+        
+        # Write aside and rename, so a crash never leaves a half-written cache.
+        try:
+            with open(self.cache_path + '.tmp', 'w', encoding = 'utf-8') as f:
+                json.dump(user_agents, f, indent = 1)
+            os.replace(self.cache_path + '.tmp', self.cache_path)
+        except OSError:
+            logger.warning("Fail to write the user agent cache {}.".format(self.cache_path))
+        
+        return user_agents
+    
+    def pick(self, exclude:str = None) -> str:
+        """
+        Draw a user agent, other than `exclude` if the pool has another one.
+        """
+        user_agents = self.load()
+        choices = [user_agent for user_agent in user_agents if user_agent != exclude] or user_agents
+        
+        return random.choice(choices)
+
+USER_AGENTS = UserAgentPool()
+
 class Maintainer(object):
     def __init__(self, hold_second: int): 
         self.content = None
@@ -105,6 +413,17 @@ class Maintainer(object):
             return True
         else:
             return datetime.now() - self.birth_time > timedelta(seconds = self.hold_second)
+        
+    def remaining_seconds(self) -> float:
+        if self.set_content == False:
+            return 0
+        return self.hold_second - (datetime.now() - self.birth_time).total_seconds()
+    
+    def invalidate(self):
+        '''
+        Mark the content as expired before its time, e.g. the server has dropped the session.
+        '''
+        self.set_content = False
     
     def update_content(self, content:Any):
         '''
@@ -124,6 +443,208 @@ class Maintainer(object):
         else:
             return self.content
     
+class LecturePool(object):
+    '''
+    The lectures already checked, keyed by the normalised aid.
+    
+    The server sends aid either as str or int, so both are normalised to str before lookup.
+    The expiry times are kept in a min-heap, so clearing only touches the expired lectures.
+    '''
+    
+    def __init__(self):
+        self.expire_times:Dict[str,datetime] = {}
+        self.heap:List[Tuple[datetime,str]] = []
+        
+    def __repr__(self) -> str:
+        return f'LecturePool with {len(self)} lecture(s)'
+    
+    def __len__(self) -> int:
+        return len(self.expire_times)
+    
+    def __contains__(self, aid:Union[str,int]) -> bool:
+        return self.normalize(aid) in self.expire_times
+    
+    def __iter__(self):
+        return iter(self.expire_times)
+    
+    @staticmethod
+    def normalize(aid:Union[str,int]) -> str:
+        return normalize_aid(aid)
+    
+    def add(self, aid:Union[str,int], expire_time:datetime):
+        aid = self.normalize(aid)
+        
+        self.expire_times[aid] = expire_time
+        heapq.heappush(self.heap, (expire_time, aid))
+        
+    def clear_expired(self, now:datetime = None) -> List[str]:
+        """
+        Remove the lectures whose registration has ended.
+
+        Returns:
+            List[str]: The aids removed.
+        """
+        if now is None:
+            now = datetime.now()
+        
+        removed = []
+        
+        while len(self.heap) > 0 and self.heap[0][0] <= now:
+            expire_time, aid = heapq.heappop(self.heap)
+            
+            # A lecture added again has a newer entry in the heap, skip the outdated one.
+            if self.expire_times.get(aid) != expire_time:
+                continue
+            
+            del self.expire_times[aid]
+            removed.append(aid)
+            
+        return removed
+    
+    def discard(self, aid:Union[str,int]):
+        """
+        Remove a lecture before its registration ends. Its entry in the heap is skipped when it comes up.
+        """
+        self.expire_times.pop(self.normalize(aid), None)
+    
+    @classmethod
+    def from_maintainers(cls, maintainers:Set[Maintainer]) -> 'LecturePool':
+        """
+        Convert the pool saved by the previous versions, which is a set of Maintainer.
+        """
+        pool = cls()
+        
+        for maintainer in maintainers:
+            pool.add(maintainer.get_content(force_get = True), 
+                    maintainer.birth_time + timedelta(seconds = maintainer.hold_second))
+        
+        return pool
+
+class SearchSnapshot(object):
+    '''
+    The last result of one search, so the pages and lectures unchanged since then can be skipped.
+    
+    Each page keeps the hash of its body, the validators for conditional requests (ETag, Last-Modified) 
+    if the server sends any, and a fingerprint per lecture.
+    '''
+    
+    def __init__(self):
+        self.page_hashes:Dict[int,str] = {}
+        self.validators:Dict[int,Dict[str,str]] = {}
+        self.fingerprints:Dict[int,Dict[str,int]] = {}
+        
+    def conditional_headers(self, page:int) -> Dict[str,str]:
+        validator = self.validators.get(page, {})
+        headers = {}
+        
+        if 'ETag' in validator:
+            headers['If-None-Match'] = validator['ETag']
+        if 'Last-Modified' in validator:
+            headers['If-Modified-Since'] = validator['Last-Modified']
+            
+        return headers
+    
+    def update_page(self, page:int, response:requests.Response, content_hash:str = None) -> bool:
+        """
+        Record the response of a page.
+        
+        Args:
+            content_hash (str, optional): The sha1 of the body, if it was streamed. Defaults to None, which hashes response.content.
+
+        Returns:
+            bool: whether the page has changed since the last time.
+        """
+        if response.status_code == 304:
+            return False
+        
+        self.validators[page] = {key: response.headers[key] for key in ('ETag', 'Last-Modified') if key in response.headers}
+        
+        if content_hash is None:
+            content_hash = hashlib.sha1(response.content).hexdigest()
+        changed = self.page_hashes.get(page) != content_hash
+        self.page_hashes[page] = content_hash
+        
+        return changed
+    
+    def known_fingerprints(self) -> Dict[str,int]:
+        known:Dict[str,int] = {}
+        for fingerprints in list(self.fingerprints.values()):
+            known.update(fingerprints)
+        return known
+
+class CaptchaPool(object):
+    '''
+    A small pool of downloaded and recognized captchas, so a re-login only pays for the login request.
+    
+    Each captcha is held by a Maintainer, and dropped once it is older than max_age.
+    The pool is only topped up right before a planned login, refer to RUCSpider.keep_session,
+    since a captcha lives minutes and a cookie hours.
+    '''
+    
+    def __init__(self, 
+                fetch   : Callable[[], Tuple[str,str]], 
+                size    : int = CAPTCHA_POOL_SIZE, 
+                max_age : int = CAPTCHA_MAX_AGE):
+        """
+        Args:
+            fetch (Callable[[], Tuple[str,str]]): returns a new (captcha_id, captcha).
+            size (int, optional): The number of captchas kept. Defaults to CAPTCHA_POOL_SIZE.
+            max_age (int, optional): The seconds a captcha is considered usable. Defaults to CAPTCHA_MAX_AGE.
+        """
+        self.fetch = fetch
+        self.size = size
+        self.max_age = max_age
+        
+        self.captchas:deque = deque()
+        self.lock = threading.Lock()
+        self.refill_lock = threading.Lock()
+        
+    def __len__(self) -> int:
+        return len(self.captchas)
+        
+    def get(self) -> Union[Tuple[str,str], None]:
+        """
+        Take the freshest usable captcha.
+
+        Returns:
+            Tuple[str,str] | None: (captcha_id, captcha), None if the pool has nothing usable.
+        """
+        captcha = None
+        
+        with self.lock:
+            while len(self.captchas) > 0 and captcha is None:
+                captcha = self.captchas.pop().get_content()
+        
+        return captcha
+    
+    def refill(self, background:bool = True):
+        """
+        Drop the expired captchas and fetch new ones until the pool is full.
+        Only one refill runs at a time, the others return immediately.
+        """
+        if background:
+            threading.Thread(target = self.refill, args = (False,), daemon = True).start()
+            return
+        
+        if not self.refill_lock.acquire(blocking = False):
+            return
+        
+        try:
+            with self.lock:
+                self.captchas = deque(maintainer for maintainer in self.captchas if not maintainer.is_expired())
+            
+            while len(self.captchas) < self.size:
+                captcha = self.fetch()
+                
+                maintainer = Maintainer(self.max_age)
+                maintainer.update_content(captcha)
+                with self.lock:
+                    self.captchas.append(maintainer)
+        except Exception as e:
+            logger.warning("Fail to prefetch captcha: {}".format(e))
+        finally:
+            self.refill_lock.release()
+    
 class SelectorManager(object):
     def __init__(self):
         self.source_selector:Dict[str:Dict[str,List[str]]] = SELECTORS
@@ -194,6 +715,123 @@ class SelectorManager(object):
             
         return mappings
 
+class Watch(object):
+    '''
+    A subscription of the spider: a category of lectures, a query and a filter.
+    
+    A spider may hold many watches, they are merged into as few searches as possible by plan_searches.
+    '''
+    
+    def __init__(self,
+                lecture_type   : List[str] = ["","",""],
+                query          : str       = "",
+                filter_function: Callable  = None,
+                name           : str       = '',
+                preference     : float     = 0.0):
+        """
+        Args:
+            lecture_type (List[str], optional): The selectors, as shown in SELECTORS. Defaults to ["","",""].
+            query (str, optional): The query string sent to the server. Defaults to "".
+            filter_function (Callable, optional): The local filter of the lectures. Defaults to is_not_end.
+            name (str, optional): The name shown in logs. Defaults to the selectors and the query.
+            preference (float, optional): The lectures of the watches preferred more are registered first,
+                refer to priority.RULES. Defaults to 0.0.
+        """
+        self.lecture_type = list(lecture_type)
+        self.query = query
+        self.filter_function = is_not_end if filter_function is None else filter_function
+        self.mapping:Tuple[int,int,int] = tuple(SelectorManager().get_mapping(self.lecture_type))
+        self.name = name or '/'.join([part for part in self.lecture_type + [query] if part not in ('', '不限')])
+        self.preference = preference
+        
+    def __repr__(self) -> str:
+        return f'Watch {self.name}'
+    
+    @property
+    def reads_raw(self) -> bool:
+        """
+        Whether the filter is a custom one, which may read any field of the server, refer to Lecture.
+        """
+        return self.filter_function is not is_not_end
+    
+    def accepts(self, lecture:Lecture, mapping:Tuple[int,int,int]) -> Union[bool, None]:
+        """
+        Whether the lecture, found by a search of `mapping`, belongs to this watch.
+
+        Returns:
+            bool | None: None if the search is broader than the watch, 
+                and the lecture carries no category to tell.
+        """
+        for level, (wanted, searched) in enumerate(zip(self.mapping, mapping)):
+            if wanted == 0 or wanted == searched:
+                continue
+            
+            category = lecture.typelevels[level]
+            if category is None:
+                return None
+            if category != wanted:
+                return False
+            
+        return bool(self.filter_function(lecture))
+
+class SearchPlan(object):
+    '''
+    One search sent to the server, and the watches its result is routed to.
+    '''
+    
+    def __init__(self, mapping:Tuple[int,int,int], query:str, watches:List[Watch]):
+        self.mapping = mapping
+        self.query = query
+        self.watches = watches
+        
+    def __repr__(self) -> str:
+        return f'SearchPlan {list(self.mapping)} {self.query!r} for {self.watches}'
+    
+    def is_broadened(self) -> bool:
+        return any(watch.mapping != self.mapping for watch in self.watches)
+
+def plan_searches(watches:List[Watch], broaden:bool = True) -> List[SearchPlan]:
+    """
+    Merge the watches into as few searches as possible.
+    
+    Watches with the same query share a search. When broaden is set, watches of the same first level category 
+    are merged into one search of their common category, and a watch of no category takes in all the others.
+    The result is then filtered locally by Watch.accepts.
+
+    Args:
+        watches (List[Watch]): The watches to merge.
+        broaden (bool, optional): merge different categories into a broader search. Defaults to True.
+
+    Returns:
+        List[SearchPlan]: The searches to send.
+    """
+    groups:Dict[Tuple,List[Watch]] = {}
+    
+    for watch in watches:
+        if not broaden:
+            key = (watch.query, watch.mapping)
+        elif any(other.query == watch.query and other.mapping[0] == 0 for other in watches):
+            key = (watch.query, 0)
+        else:
+            key = (watch.query, watch.mapping[0])
+        groups.setdefault(key, []).append(watch)
+        
+    plans = []
+    
+    for (query, _), members in groups.items():
+        # The common category of the members, every level after the first difference is left open.
+        mapping = []
+        for level in range(3):
+            categories = set(watch.mapping[level] for watch in members)
+            if len(categories) > 1 or (len(mapping) > 0 and mapping[-1] == 0):
+                mapping.append(0)
+            else:
+                mapping.append(categories.pop())
+                
+        plans.append(SearchPlan(tuple(mapping), query, members))
+        
+    return plans
+
 class RUCSpider(object):
     '''
     This class is responsible for interact with ruc server. which includes:
@@ -204,9 +842,62 @@ class RUCSpider(object):
     2. maintain the cookie so the server is always accessble.
     '''
     
-    def __init__(self, load_path:str = './spider.pkl'): 
+    def __init__(self, load_path:str = './spider.pkl', pool_size:int = POOL_SIZE, base_url:str = BASE_URL): 
+        
+        self.base_url = base_url
+        self.cookie_lock = threading.Lock()
+        self.scheduler = schedule.Scheduler()
+        self.wake_event = threading.Event()
+        self.captcha_pool = CaptchaPool(self.recognize_captcha)
+        self.snapshots:Dict[str,SearchSnapshot] = {}
+        self.retries:Dict[str,Tuple[Lecture,float]] = {}
+        self.retry_lock = threading.Lock()
+        self.polls_skipped:int = 0
+        self.watches:List[Watch] = []
+        self.broaden_searches:bool = True
+        self.registration_rules:Tuple[str, ...] = DEFAULT_RULES
+        self.sniper:Sniper = None
+        self.store:StateStore = None
+        
+        self.user_id   : str = ''
+        self.passward  : str = ''
+        self.token     : str = ''
+        self.captcha   : str = ''
+        self.captcha_id: str = ''
+        
+        self.running:bool = False
+        
+        self.save_path = load_path
+        
+        self.user_agent:str = USER_AGENTS.pick()
+        self.pool_size:int = pool_size
+        self.client:requests.Session = create_client(pool_size)
+        self.cookie_maintainer:Maintainer = Maintainer(COOKIE_VALID_TIME)
         
-        if load_path != None and os.path.exists(load_path):
+        self.lecture_pool_checked:LecturePool = LecturePool()
+        self.publications:PublicationHistogram = PublicationHistogram()
+        self.mapping:Dict[str:int] = ALIAS
+        self.locking:bool = False
+        
+        self.notify_method: Methods = 'Void'
+        
+        path = store_path(load_path)
+        
+        if path != MEMORY and os.path.exists(path):
+            try:
+                self.store = StateStore(path)
+                self.load_store()
+                logger.success("Success load previous spider state.")
+                return
+            except:
+                logger.error("Fail to load previous spider state, it is moved to {}. Initializing a new one.".format(path + '.broken'))
+                if self.store is not None:
+                    self.store.close()
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists(path + suffix):
+                        os.replace(path + suffix, path + '.broken' + suffix)
+        
+        if load_path != None and load_path != path and os.path.exists(load_path):
             try:
                 with open(load_path, 'rb') as f:
                     oldspider:RUCSpider = pickle.load(f)
@@ -216,38 +907,54 @@ class RUCSpider(object):
                     self.captcha = oldspider.captcha
                     self.captcha_id = oldspider.captcha_id
                     self.lecture_pool_checked = oldspider.lecture_pool_checked
+                    self.publications = oldspider.publications
                     self.mapping = oldspider.mapping
                     self.cookie_maintainer = oldspider.cookie_maintainer
-                    self.ua = oldspider.ua
-                    self.save_path = load_path
-                    self.running = False
-                    self.locking = False
+                    self.user_agent = oldspider.user_agent
+                    self.pool_size = oldspider.pool_size
+                    self.client = oldspider.client
                     
-                    print(self.captcha, self.captcha_id)
+                    logger.debug("Loaded captcha {} of id {}.".format(self.captcha, self.captcha_id))
                     
                 logger.success("Success load previous spider instance.")
-                return
             except:
                 logger.error("Fail to load previous spider instance. Initializing a new one.")
         
-        self.user_id   : str = ''
-        self.passward  : str = ''
-        self.token     : str = ''
-        self.captcha   : str = ''
-        self.captcha_id: str = ''
+        # The pickle of the previous versions is carried over to the store once.
+        self.store = StateStore(path)
+        self.store.add_lectures(self.lecture_pool_checked.expire_times.items())
+        self.save_cookie()
+        self.save()
         
-        self.running:bool = False
+    def load_store(self):
+        """
+        Load the state kept in the store. Only the lectures still open for registration are read.
+        """
+        profile = self.store.load_profile()
         
-        self.save_path = load_path
+        self.user_id    = profile.get('user_id', '')
+        self.passward   = profile.get('passward', '')
+        self.token      = profile.get('token', '')
+        self.captcha    = profile.get('captcha', '')
+        self.captcha_id = profile.get('captcha_id', '')
+        self.mapping    = profile.get('mapping', ALIAS)
+        self.user_agent = profile.get('user_agent') or self.user_agent
         
-        self.ua = UserAgent()
-        self.cookie_maintainer:Maintainer = Maintainer(COOKIE_VALID_TIME)
+        if profile.get('pool_size', self.pool_size) != self.pool_size:
+            self.set_pool_size(profile['pool_size'])
         
-        self.lecture_pool_checked:Set[Maintainer] = set()
-        self.mapping:Dict[str:int] = ALIAS
-        self.locking:bool = False
+        if 'cookie' in profile:
+            self.cookie_maintainer.update_content(profile['cookie']['content'])
+            self.cookie_maintainer.birth_time = datetime.fromisoformat(profile['cookie']['birth_time'])
         
-        self.notify_method: Methods = 'Void'
+        if 'publications' in profile:
+            self.publications.decay        = profile['publications']['decay']
+            self.publications.counts       = profile['publications']['counts']
+            self.publications.observations = profile['publications']['observations']
+        
+        self.store.compact()
+        for aid, expire_time in self.store.load_lectures():
+            self.lecture_pool_checked.add(aid, expire_time)
         
     def __repr__(self) -> str:
         return 'Spider'
@@ -261,7 +968,10 @@ class RUCSpider(object):
                         'captcha_id': self.captcha_id, 
                         'lecture_pool_checked': self.lecture_pool_checked, 
                         'mapping': self.mapping, 
-                        'cookie_maintainer': self.cookie_maintainer}
+                        'cookie_maintainer': self.cookie_maintainer,
+                        'pool_size': self.pool_size,
+                        'publications': self.publications,
+                        'user_agent': self.user_agent}
         
         return information
     
@@ -273,43 +983,84 @@ class RUCSpider(object):
         self.captcha   = state['captcha']
         self.captcha_id= state['captcha_id']
         self.lecture_pool_checked = state['lecture_pool_checked']
+        if isinstance(self.lecture_pool_checked, set):
+            self.lecture_pool_checked = LecturePool.from_maintainers(self.lecture_pool_checked)
         self.mapping   = state['mapping']
         self.cookie_maintainer = state['cookie_maintainer']
 
-        self.ua = UserAgent()
+        self.user_agent = state.get('user_agent') or USER_AGENTS.pick()
+        self.pool_size = state.get('pool_size', POOL_SIZE)
+        self.publications = state.get('publications', PublicationHistogram())
+        self.base_url = BASE_URL
+        self.client = create_client(self.pool_size)
+        self.cookie_lock = threading.Lock()
+        self.scheduler = schedule.Scheduler()
+        self.wake_event = threading.Event()
+        self.captcha_pool = CaptchaPool(self.recognize_captcha)
+        self.snapshots = {}
+        self.retries = {}
+        self.retry_lock = threading.Lock()
+        self.polls_skipped = 0
+        self.watches = []
+        self.broaden_searches = True
+        self.registration_rules = DEFAULT_RULES
+        self.sniper = None
+        self.store = None
+        
+    def set_adapter(self, adapter:HTTPAdapter):
+        """
+        Send the requests through a connection pool shared with other spiders. 
+        The cookie jar stays with this spider.
+        """
+        self.client.mount('https://', adapter)
+        self.client.mount('http://', adapter)
         
-    def get_token(self):
+    def set_pool_size(self, pool_size:int):
         """
-        Get the tokens, which is used to login.
+        Rebuild the client with a new pool size. The cookie jar is carried over.
         """
+        cookies = self.client.cookies
+        self.client.close()
         
-        token_url = r"https://v.ruc.edu.cn/auth/login?&proxy=true&redirect_uri=https://v.ruc.edu.cn/oauth2/authorize?client_id=accounts.tiup.cn&redirect_uri=https://v.ruc.edu.cn/sso/callback?school_code=ruc&theme=schools&response_type=code&school_code=ruc&scope=all&state=jnTBbsfBumjuSrfZ&theme=schools&school_code=ruc"
+        self.pool_size = pool_size
+        self.client = create_client(pool_size)
+        self.client.cookies.update(cookies)
         
-        headers = {'user-Agent': self.ua.random}
+    def get_token(self, user_agent:str = None):
+        """
+        Get the tokens, which is used to login.
         
-        html_with_token:str = query_html(method = 'GET', 
-                                    output_format = 'text',
-                                    url     = token_url, 
-                                    headers = headers)
+        Args:
+            user_agent (str, optional): The user agent of the login to come. Defaults to None, which is self.user_agent.
+        """
+        
+        token_url = self.base_url + r"/auth/login?&proxy=true&redirect_uri=https://v.ruc.edu.cn/oauth2/authorize?client_id=accounts.tiup.cn&redirect_uri=https://v.ruc.edu.cn/sso/callback?school_code=ruc&theme=schools&response_type=code&school_code=ruc&scope=all&state=jnTBbsfBumjuSrfZ&theme=schools&school_code=ruc"
         
-        token_regex = re.compile(r'(?<=<input type="hidden" name="csrftoken" value=")([\S]+)(?=" id="csrftoken" \/>)')
+        headers = {'user-Agent': user_agent or self.user_agent}
         
-        self.token = re.search(token_regex, html_with_token)[0]
+        with METRICS.measure('token'):
+            html_with_token:str = query_html(method = 'GET', 
+                                        output_format = 'text',
+                                        session = self.client,
+                                        url     = token_url, 
+                                        headers = headers)
+            
+            self.token = TOKEN_REGEX.search(html_with_token)[0]
         
         
     def get_captcha(self, manual = False):
         
         logger.info("Retrieving and recognize captcha")
         
-        captcha_url = r"https://v.ruc.edu.cn/auth/captcha"
-        headers = {'user-Agent': self.ua.random}
+        captcha_url = self.base_url + r"/auth/captcha"
+        headers = {'user-Agent': self.user_agent}
         
-        captcha_json:Dict = query_html(url  = captcha_url,
-                                    headers = headers)
-        
-        b64_regex = re.compile(r"(?<=data:image\/png;base64,)([\S]+)")
-        
-        b64_image_str:str = re.search(b64_regex, captcha_json["b64s"])[0]
+        with METRICS.measure('captcha'):
+            captcha_json:Dict = query_html(session = self.client,
+                                        url  = captcha_url,
+                                        headers = headers)
+            
+            b64_image_str:str = CAPTCHA_REGEX.search(captcha_json["b64s"])[0]
         b64_image_bytes:bytes = bytes(b64_image_str, encoding = 'utf-8')
         
         captcha_id:str = captcha_json["id"]
@@ -318,12 +1069,22 @@ class RUCSpider(object):
         if manual:
             return data_img, captcha_id
         
-        from ddddocr import DdddOcr
-        ocr = DdddOcr(show_ad = False)
-        
-        captcha = ocr.classification(data_img)
+        with METRICS.measure('ocr'):
+            captcha = OCR_ENGINE.classification(data_img)
 
         self.set_captcha(captcha_id, captcha)
+        
+    def recognize_captcha(self) -> Tuple[str,str]:
+        """
+        Download and recognize a captcha without using it, which is how the captcha pool is filled.
+
+        Returns:
+            Tuple[str,str]: (captcha_id, captcha)
+        """
+        data_img, captcha_id = self.get_captcha(manual = True)
+        
+        with METRICS.measure('ocr'):
+            return captcha_id, OCR_ENGINE.classification(data_img)
     
     def set_user(self, user_id:str, passward:str):
         self.user_id = user_id
@@ -347,24 +1108,33 @@ class RUCSpider(object):
     def is_running(self):
         return self.running
     
+    @TRACER.traced('login')
     @logger.catch
     @retry(retry = retry_if_exception(ValueError),
             stop  = stop_after_attempt(5),
             wait = wait_fixed(0.5),
             reraise = True)
-    def create_session(self) -> Union [requests.Session, bool]:
+    def create_session(self, user_agent:str = None) -> Union [requests.Session, bool]:
+        # The login may come with a new user agent, which the spider only takes once the login succeeds.
+        user_agent = user_agent or self.user_agent
+        
         # Check the integrity of the params.
         if self.user_id == '' or self.passward == '':
             raise Exception("user_id or passward is not set")
         
         if self.token == '':
-            self.get_token()
+            self.get_token(user_agent)
             
         if self.captcha == '' or self.captcha_id == '':
-            logger.info("No available captcha, retrieving one...")
-            self.get_captcha()
+            prefetched = self.captcha_pool.get()
             
-        target_url = r"https://v.ruc.edu.cn/auth/login"
+            if prefetched is not None:
+                self.set_captcha(*prefetched)
+            else:
+                logger.info("No available captcha, retrieving one...")
+                self.get_captcha()
+            
+        target_url = self.base_url + r"/auth/login"
         
         params = {
         "username"          : f"ruc:{self.user_id}",
@@ -377,12 +1147,18 @@ class RUCSpider(object):
         "token"             : f"{self.token}",
         "captcha_id"        : f"{self.captcha_id}"}
         
-        headers = {'user-Agent': self.ua.random}
+        headers = {'user-Agent': user_agent}
         
-        session = requests.Session()
-        server_response:requests.Response = session.post(url  = target_url,
-                                    headers = headers,
-                                    json    = params)
+        # Drop the expired cookies, so the jar only holds the new session.
+        session = self.client
+        session.cookies.clear()
+        with METRICS.measure('login'):
+            server_response:requests.Response = query_html(method        = 'POST',
+                                                        output_format = 'response',
+                                                        session       = session,
+                                                        url           = target_url,
+                                                        headers       = headers,
+                                                        json          = params)
         
         response_text = server_response.text
         
@@ -394,21 +1170,38 @@ class RUCSpider(object):
                 self.reset_captcha()
                 raise ValueError("captcha error")
             else:
-                raise Exception(response_text["error_description"])
+                raise Exception(response_json["error_description"])
         logger.success("Re-establish session with remote server.")
         self.reset_captcha()
         return session
         
     def refresh_cookie(self):
         
-        session = self.create_session()
+        # A new session comes with a new browser, and keeps it until the next login.
+        # The old session keeps its browser until the new one is logged in, so no request mixes the two.
+        user_agent = USER_AGENTS.pick(exclude = self.user_agent)
+        METRICS.increment('logins')
+        session = self.create_session(user_agent)
         
         if session is None:
             return session
+        self.user_agent = user_agent
         cookie = session.cookies.get_dict()
         self.cookie_maintainer.update_content(cookie)
+        self.save_cookie()
         return session
     
+    def login(self):
+        """
+        Log in now with the user and captcha set, e.g. from the login window.
+        The polls and the background refresh wait for it rather than log in at the same time.
+        
+        Returns:
+            requests.Session: None if the login fails.
+        """
+        with self.cookie_lock:
+            return self.refresh_cookie()
+    
     def set_notify(self, notify: Methods):
         self.notify_method = notify
         self.notice = NOTIFIER[self.notify_method]
@@ -416,155 +1209,787 @@ class RUCSpider(object):
     def export_cookie(self) -> str:
         cookie = self.cookie_maintainer.get_content()
         if cookie is None:
-            logger.warning("cookie expired, refreshing...")
-            self.refresh_cookie()
-            cookie = self.cookie_maintainer.get_content()
+            # Only one thread logs in, the others wait and reuse the new cookie.
+            with self.cookie_lock:
+                cookie = self.cookie_maintainer.get_content()
+                if cookie is None:
+                    logger.warning("cookie expired, refreshing...")
+                    self.refresh_cookie()
+                    cookie = self.cookie_maintainer.get_content()
         
         return cookie
     
+    def invalidate_cookie(self, used_cookie:Dict):
+        """
+        Drop the cookie the server refused. 
+        If another thread has already replaced it, the new cookie is kept.
+        """
+        with self.cookie_lock:
+            if self.cookie_maintainer.get_content(force_get = True) is used_cookie:
+                self.cookie_maintainer.invalidate()
+                self.save_cookie()
+    
+    def refresh_cookie_ahead(self):
+        """
+        Log in again while the old cookie still works, so no request waits for the login.
+        """
+        if not self.cookie_lock.acquire(blocking = False):
+            return
+        
+        try:
+            logger.info("cookie is about to expire, refreshing in background...")
+            self.refresh_cookie()
+        finally:
+            self.cookie_lock.release()
+    
+    def keep_session(self):
+        """
+        Start a background refresh once the cookie gets within COOKIE_REFRESH_AHEAD seconds of expiry.
+        The check before that prefetches the captchas of the login, so they are fresh when it comes.
+        """
+        if self.user_id == '' or self.passward == '':
+            return
+        
+        remaining = self.cookie_maintainer.remaining_seconds()
+        
+        if remaining > COOKIE_REFRESH_AHEAD + SESSION_CHECK_INTERVAL:
+            return
+        
+        if remaining > COOKIE_REFRESH_AHEAD:
+            self.captcha_pool.refill()
+            return
+        
+        threading.Thread(target = self.refresh_cookie_ahead, daemon = True).start()
+    
+    def ping(self):
+        """
+        Send a light request, so a connection to the server is open in the pool.
+        """
+        query_html(method        = 'GET',
+                output_format = 'response',
+                session       = self.client,
+                url           = self.base_url,
+                headers       = {'user-Agent': self.user_agent})
+    
+    @staticmethod
+    def is_logged_out(response:requests.Response, check_body:bool = True) -> bool:
+        """
+        Whether the server has refused the session: 
+        it redirects to the login page, or answers with an auth error, in the status or in a json body.
+        
+        Args:
+            check_body (bool, optional): look into the body too, False for a body still streaming. Defaults to True.
+        """
+        if response.status_code in (401, 403):
+            return True
+        
+        if LOGIN_URL_MARK in response.url:
+            return True
+        
+        for history in response.history:
+            if LOGIN_URL_MARK in history.headers.get('Location', ''):
+                return True
+        
+        if check_body:
+            return RUCSpider.is_auth_error(response.content)
+            
+        return False
+    
+    @staticmethod
+    def is_auth_error(body:bytes) -> bool:
+        """
+        Whether a json body is an auth error. Only the small bodies are parsed, the search results never are.
+        """
+        if len(body) > AUTH_ERROR_MAX_BYTES or not body.lstrip().startswith(b'{'):
+            return False
+        
+        try:
+            content = json.loads(body)
+        except ValueError:
+            return False
+        
+        if not isinstance(content, dict):
+            return False
+        
+        if content.get('code') in AUTH_ERROR_CODES or content.get('error') in AUTH_ERROR_TYPES:
+            return True
+        
+        message = str(content.get('msg') or content.get('message') or '')
+        return any(mark in message for mark in AUTH_ERROR_MESSAGES)
+    
+    def query_server(self, 
+                    method       : Literal['GET', 'POST']    = 'POST', 
+                    output_format: Literal['json','response','stream'] = 'json',
+                    **kwargs) -> Union[Dict, requests.Response, None]:
+        """
+        Query the server with the current cookie, and return the json.
+        When the server turns out to have dropped the session, log in again and resend once.
+
+        Args:
+            method (Literal[GET|POST], optional): The method of the request. Defaults to 'POST'.
+            output_format (Literal[json|response|stream], optional): return the json, the whole response, 
+                or the response with its body still to read. Defaults to 'json'.
+            **kwargs: The parameters of the request, without cookies.
+
+        Returns:
+            Dict | requests.Response | None: The json or the response, None if the request fails.
+        """
+        for _ in range(2):
+            cookie = self.export_cookie()
+            
+            response:requests.Response = query_html(
+                method        = method,
+                output_format = 'stream' if output_format == 'stream' else 'response',
+                session       = self.client,
+                cookies       = cookie,
+                **kwargs)
+            
+            if response is None:
+                return None
+            
+            # A streamed body is looked into only if it ends within the size of an auth error,
+            # a chunked one has no Content-Length to tell.
+            small = output_format != 'stream' or read_ahead(response, AUTH_ERROR_MAX_BYTES)
+            
+            if not self.is_logged_out(response, check_body = small):
+                return response.json() if output_format == 'json' else response
+            
+            response.close()
+            logger.warning("session refused by server, refreshing...")
+            self.invalidate_cookie(cookie)
+            
+        return None
+    
     # The following is about interact with server.
     
-    def regist(self, lecture_id:str) -> str:
-        regist_url = r"https://v.ruc.edu.cn/campus/Regist/regist"
+    @TRACER.traced('registration')
+    def regist(self, lecture_id:str) -> Union[str, None]:
+        regist_url = self.base_url + r"/campus/Regist/regist"
         
         params = {"aid":lecture_id}
-        headers = {'User-Agent': self.ua.random}
+        headers = {'User-Agent': self.user_agent}
+        
+        with METRICS.measure('registration'):
+            response:Dict[str,str] = self.query_server(
+                method = 'POST',
+                url = regist_url,
+                headers = headers,
+                json = params
+            )
+            
+            if response is None:
+                METRICS.increment('registration_failures')
+                return None
+            
+            result = response["msg"]
+        
+        if result == "注册成功":
+            METRICS.increment('registrations')
+            self.store.mark_registered(LecturePool.normalize(lecture_id))
         
-        response:Dict[str,str] = query_html(
-            method = 'POST',
-            url = regist_url,
-            headers = headers,
-            json = params,
-            cookies = self.export_cookie()
-        )
+        return result
+    
+    def regist_queued(self, entries:Iterable[Tuple[Lecture, float]], concurrency:int = REGIST_CONCURRENCY) -> Dict[str, str]:
+        """
+        Register the lectures in the order of self.registration_rules rather than the order they are found.
+        entries may be a stream, a lecture arriving later goes ahead of the ones still waiting for a free slot.
+
+        Args:
+            entries (Iterable[Tuple[Lecture, float]]): The lectures, and the preference of the watch of each.
+            concurrency (int, optional): The max number of registrations on the fly. Defaults to REGIST_CONCURRENCY.
+
+        Returns:
+            Dict[str, str]: The message from the server of each aid.
+        """
+        # Make sure the cookie is ready, so the workers do not race for a login.
+        self.export_cookie()
         
-        return response["msg"]
+        return RegistrationQueue(self.registration_rules).dispatch(entries, self.regist, concurrency)
+    
+    def is_checked(self, lecture:Lecture) -> bool:
+        return lecture.aid in self.lecture_pool_checked.expire_times
     
-    def notice(self, lectures: List[Dict]):
+    def search_lectures(self,
+                        perpage     : int             = 30,
+                        mapping     : Tuple[int, ...] = (0,0,0),
+                        query       : str             = "",
+                        max_pages   : int       = MAX_PAGES,
+                        concurrency : int       = PAGE_CONCURRENCY,
+                        incremental : bool      = True,
+                        stream      : bool      = True,
+                        keep_raw    : bool      = False) -> Iterator[Lecture]:
+        """
+        Walk through the pages of the search result, and yield the lectures one by one.
+        
+        The first page is fetched alone, since it is usually the last one needed. 
+        After that, pages are fetched `concurrency` at a time. 
+        The search stops at a short page, or a page with only checked or ended lectures.
+        
+        In incremental mode, only the lectures added or changed since the last same search are yielded,
+        and the search stops at the first page which has not changed at all.
+        
+        In stream mode, a page is decoded as it downloads, and each lecture is yielded as soon as it arrives
+        rather than after the last byte of the page. At most STREAM_QUEUE_SIZE lectures of a page wait in memory,
+        however large the pages are.
+
+        Args:
+            perpage (int, optional): The number of lectures per page. Defaults to 30.
+            mapping (Tuple[int, ...], optional): The categories of the lectures, refer to SelectorManager.get_mapping. Defaults to (0,0,0).
+            query (str, optional): The query string. Defaults to "".
+            max_pages (int, optional): The max number of pages to fetch. Defaults to MAX_PAGES.
+            concurrency (int, optional): The max number of pages fetched at the same time. Defaults to PAGE_CONCURRENCY.
+            incremental (bool, optional): skip what has not changed since the last search. Defaults to True.
+            stream (bool, optional): decode the pages while they download. Defaults to True.
+            keep_raw (bool, optional): keep every field of the server on the lectures, for custom filters. Defaults to False.
+
+        Yields:
+            Lecture: The lecture, in the order the server returns.
+        """
+        campus_url = self.base_url + r"/campus/v2/search"
+        
+        headers = {'user-Agent': self.user_agent}
+        
+        search_key = json.dumps([perpage, list(mapping), query], ensure_ascii = False)
+        snapshot = self.snapshots.setdefault(search_key, SearchSnapshot())
+        
+        # Set once the search is over, so the pages still downloading give up.
+        stopped = threading.Event()
+        
+        def fetch_page(page:int, emit:Callable[[Lecture], bool]) -> Tuple[bool, bool]:
+            """
+            Pass the lectures on the page to `emit`, only the changed ones in incremental mode.
+            Returns whether the page changed, and whether it is the last page to fetch.
+            """
+            params = {
+            "perpage"      : perpage,
+            "page"         : page,
+            "typelevel1"   : mapping[0],
+            "typelevel2"   : mapping[1],
+            "typelevel3"   : mapping[2],
+            "applyscore"   : 0,
+            "begintime"    : "",
+            "location"     : "",
+            "progress"     : 0,
+            "owneruid"     : "",
+            "sponsordeptid": "",
+            "query"        : query,
+            "canregist"    : 0}
+            
+            # Timed up to the last byte of the body, which comes after the headers in stream mode.
+            begin = time.perf_counter()
+            
+            response:requests.Response = self.query_server(
+                method        = 'POST',
+                output_format = 'stream' if stream else 'response',
+                url           = campus_url,
+                headers       = {**headers, **snapshot.conditional_headers(page)} if incremental else headers,
+                json          = params)
+            
+            if response is None:
+                METRICS.observe('search', time.perf_counter() - begin, error = True)
+                METRICS.increment('search_failures')
+                return True, True
+            
+            if response.status_code == 304 or not stream:
+                METRICS.observe('search', time.perf_counter() - begin)
+                changed = snapshot.update_page(page, response)
+                
+                if incremental and not changed:
+                    response.close()
+                    return False, True
+            
+            digest = hashlib.sha1()
+            
+            def read_body() -> Iterator[bytes]:
+                for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                    digest.update(chunk)
+                    yield chunk
+            
+            body = read_body()
+            lectures = stream_lectures(body, keep_raw) if stream else parse_lectures(response.content, keep_raw)
+            
+            known = snapshot.known_fingerprints() if incremental else {}
+            fingerprints:Dict[str,int] = {}
+            settled = True
+            
+            try:
+                for lec in lectures:
+                    fingerprints[lec.aid] = lec.fingerprint
+                    # Decide before handing it on, the consumer marks the lectures as checked.
+                    settled = settled and (self.is_checked(lec) or not is_not_end(lec))
+                    
+                    if known.get(lec.aid) != lec.fingerprint and not emit(lec):
+                        return True, True
+                
+                if stream:
+                    # Read the rest of the body, for the hash and to give the connection back.
+                    for _ in body:
+                        pass
+                    METRICS.observe('search', time.perf_counter() - begin)
+            except requests.exceptions.RequestException as e:
+                METRICS.observe('search', time.perf_counter() - begin, error = True)
+                METRICS.increment('search_failures')
+                logger.warning("Page {} broke off: {}".format(page, e))
+                return True, True
+            except ValueError as e:
+                # Not a search result, e.g. an error page of the server.
+                METRICS.observe('search', time.perf_counter() - begin, error = True)
+                METRICS.increment('search_failures')
+                logger.warning("Page {} has no lectures: {}".format(page, e))
+                return True, True
+            finally:
+                response.close()
+            
+            if stream:
+                changed = snapshot.update_page(page, response, digest.hexdigest())
+            if incremental:
+                snapshot.fingerprints[page] = fingerprints
+            
+            return changed, not changed or len(fingerprints) < perpage or settled
+        
+        def put(lectures:queue.Queue, item:Any) -> bool:
+            while not stopped.is_set():
+                try:
+                    lectures.put(item, timeout = 0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        
+        def run_page(page:int, lectures:queue.Queue):
+            """
+            Fetch the page into `lectures`, followed by the result of fetch_page, or the exception raised.
+            """
+            if stopped.is_set():
+                return
+            
+            try:
+                result = fetch_page(page, lambda lec: put(lectures, lec))
+            except Exception as e:
+                put(lectures, e)
+                return
+            
+            put(lectures, result)
+        
+        page = 1
+        window = 1
+        
+        with ThreadPoolExecutor(max_workers = max(concurrency, 1)) as executor:
+            try:
+                while page <= max_pages:
+                    pages = range(page, min(page + window, max_pages + 1))
+                    queues = [queue.Queue(maxsize = STREAM_QUEUE_SIZE) for _ in pages]
+                    # Each page runs in a copy of the context, so its spans are tied to the poll, refer to tracing.
+                    futures = [executor.submit(contextvars.copy_context().run, run_page, p, q) for p, q in zip(pages, queues)]
+                    
+                    for page_number, lectures in zip(pages, queues):
+                        item = lectures.get()
+                        while isinstance(item, Lecture):
+                            yield item
+                            item = lectures.get()
+                        
+                        if isinstance(item, Exception):
+                            raise item
+                        
+                        changed, last_page = item
+                        
+                        if not changed and page_number == 1:
+                            self.polls_skipped += 1
+                            METRICS.increment('polls_skipped')
+                            logger.info("Search result not changed, skipping.")
+                        
+                        if last_page:
+                            for rest in futures:
+                                rest.cancel()
+                            return
+                        
+                    page += len(pages)
+                    window = max(concurrency, 1)
+            finally:
+                stopped.set()
+    
+    def notice(self, lectures: List[Lecture]):
         pass
 
     def check_lecture(self,
                     max_lecture_num: int       = 30,
                     lecture_type   : List[str] = ["","",""],
                     query          : str       = "",
-                    filter_function: Callable  = None) -> Tuple[int]: 
+                    filter_function: Callable  = None,
+                    concurrency    : int       = REGIST_CONCURRENCY,
+                    max_pages      : int       = MAX_PAGES,
+                    incremental    : bool      = True) -> Tuple[int]: 
         """
         This function will pull lectures from ruc server with certain conditions and filter them.
         After that, it will maintain lecture observed, and try to register new lectures.
 
         Args:
-            max_lecture_num (int, optional): _description_. Defaults to 30.
+            max_lecture_num (int, optional): The number of lectures per page. Defaults to 30.
             lecture_type (List[str], optional): _description_. Defaults to [].
             query (str, optional): _description_. Defaults to "".
             filter (_type_, optional): _description_. Defaults to a simple function always returning True.
+            concurrency (int, optional): The max number of registrations sent at the same time. 
+                1 registers the lectures one by one. Defaults to REGIST_CONCURRENCY.
+            max_pages (int, optional): The max number of pages to search. Defaults to MAX_PAGES.
+            incremental (bool, optional): only check the lectures added or changed since the last poll. Defaults to True.
             
         >>> check_lecture(lecture_type = ["素质拓展认证","形势与政策","形势与政策讲座"])
         """
+        return self.check_watches(watches         = [Watch(lecture_type, query, filter_function)],
+                                max_lecture_num = max_lecture_num,
+                                concurrency     = concurrency,
+                                max_pages       = max_pages,
+                                incremental     = incremental)
+    
+    def enable_snipe(self, **options):
+        """
+        Register the watched lectures not open yet right at their opening, instead of at the next poll.
         
-        self.locking = True
+        Args:
+            **options: The options of sniper.Sniper, e.g. burst, spacing, lead and warmup.
+        """
+        if self.sniper is not None:
+            self.sniper.stop()
+        self.sniper = Sniper(self, **options)
+        
+    def disable_snipe(self):
+        if self.sniper is not None:
+            self.sniper.stop()
+        self.sniper = None
+    
+    def add_watch(self, watch:Watch):
+        self.watches.append(watch)
         
-        def is_not_end(lecture_info: Dict[str,Union[str,Dict]]):
-
-            end_time = lecture_info["registendtime"]
-            regist_end_time = datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S")
-            regist_over = regist_end_time > datetime.now()
+    def remove_watch(self, watch:Watch):
+        self.watches.remove(watch)
+    
+    def set_registration_rules(self, *rules:str):
+        """
+        Set the order the new lectures of a poll are registered in, the first rule decides first.
+        
+        Args:
+            *rules (str): The names of priority.RULES: 'deadline', 'seats', 'applyscore' and 'preference'.
+                No rule resets to priority.DEFAULT_RULES.
+        
+        Raises:
+            ValueError: if a rule is unknown.
+        
+        >>> spider.set_registration_rules('seats', 'deadline')
+        """
+        self.registration_rules = check_rules(rules) if len(rules) > 0 else DEFAULT_RULES
+    
+    @TRACER.traced('poll')
+    def check_watches(self,
+                    watches        : List[Watch] = None,
+                    max_lecture_num: int         = 30,
+                    concurrency    : int         = REGIST_CONCURRENCY,
+                    max_pages      : int         = MAX_PAGES,
+                    incremental    : bool        = True) -> Tuple[int]:
+        """
+        Check the lectures of many watches at once, the same as check_lecture does for one.
+        The watches are merged into as few searches as possible, refer to plan_searches.
 
-            return regist_over
+        Args:
+            watches (List[Watch], optional): The watches to check. Defaults to the watches added by add_watch.
+            The rest are the same as check_lecture.
+            
+        Returns:
+            Tuple[int]: the number of new lectures, and the number of them registered.
+        """
+        # While the server is down, the polls only add to the load. Registrations and logins still go through.
+        if BREAKER.is_open():
+            logger.info("Server unavailable, skipping the poll for another {:.0f} seconds.".format(BREAKER.remaining_seconds()))
+            return 0, 0
+        
+        self.locking = True
         
-        if filter_function is None:
-            filter_function = is_not_end
+        if watches is None:
+            watches = self.watches
             
         logger.info("Checking lectures...")
-            
-        campus_url = r"https://v.ruc.edu.cn/campus/v2/search"
+        poll_begin = time.perf_counter()
         
-        headers = {'user-Agent': self.ua.random}
+        plans = plan_searches(watches, broaden = self.broaden_searches)
         
-        params = {
-        "perpage"      : max_lecture_num,
-        "page"         : 1,
-        "typelevel1"   : self.mapping[lecture_type[0]],
-        "typelevel2"   : self.mapping[lecture_type[1]],
-        "typelevel3"   : self.mapping[lecture_type[2]],
-        "applyscore"   : 0,
-        "begintime"    : "",
-        "location"     : "",
-        "progress"     : 0,
-        "owneruid"     : "",
-        "sponsordeptid": "",
-        "query"        : query,
-        "canregist"    : 0}
-        
-        response:Dict = query_html(
-            method  = 'POST',
-            url     = campus_url,
-            headers = headers,
-            json    = params,
-            cookies = self.export_cookie())
-        
-        lectures = response['data']['data']
-        
-        lectures_filtered = list(filter(filter_function, lectures))
-        
-        new_lectures = [lec for lec in lectures_filtered if int(lec["aid"]) not in self.lecture_pool_checked]
-        
-        logger.info('Registering new {} lecture(s)'.format(len(new_lectures)))
-        
-        lectures_regist_success = []
-        
-        for lec in new_lectures:
-            regist_result:str = self.regist(lec["aid"])
-            
-            if regist_result == "注册成功":
-                lectures_regist_success.append(lec)
-                
-            duration = datetime.strptime(lec["registendtime"], "%Y-%m-%d %H:%M:%S") - datetime.now()
-            
-            duration_seconds = int(duration.total_seconds())
-            lec_maintainer = Maintainer(duration_seconds)
-            lec_maintainer.update_content(lec["aid"])
-            
-            self.lecture_pool_checked.add(lec_maintainer)
+        # The first poll finds every lecture already there, which tells nothing about when they were published.
+        first_poll = len(self.snapshots) == 0
+        
+        new_lectures = []
+        retried = []
+        preferences:Dict[str,float] = {}
+        
+        def pick_new_lectures():
+            # The lectures left without an answer go first, the search may never reach their page again.
+            for lec, preference in self.take_retries():
+                if is_not_end(lec) and not self.is_checked(lec):
+                    self.mark_checked(lec)
+                    retried.append(lec)
+                    preferences[lec.aid] = preference
+                    yield lec, preference
             
-        # print(self.lecture_pool_checked)
+            # Hand the new lectures to registration while the later pages are still on the way.
+            for plan in plans:
+                lectures = self.search_lectures(perpage     = max_lecture_num,
+                                                mapping     = plan.mapping,
+                                                query       = plan.query,
+                                                max_pages   = max_pages,
+                                                incremental = incremental,
+                                                keep_raw    = any(watch.reads_raw for watch in plan.watches))
+                
+                for lec, preference in self.route_lectures(plan, lectures, new_lectures):
+                    preferences[lec.aid] = preference
+                    yield lec, preference
+        
+        regist_results = self.regist_queued(pick_new_lectures(), concurrency)
+        
+        # Only an answer of the server counts, the lectures the server never answered for are tried at the next poll.
+        unanswered = [lec for lec in retried + new_lectures if regist_results.get(lec.aid) is None]
+        if len(unanswered) > 0:
+            logger.warning("No answer for {} registration(s), retrying them at the next poll.".format(len(unanswered)))
+            self.unmark_checked(unanswered, preferences)
+        
+        answered = [lec for lec in new_lectures if regist_results.get(lec.aid) is not None]
+        registered = answered + [lec for lec in retried if regist_results.get(lec.aid) is not None]
+        
+        logger.info('Registered new {} lecture(s)'.format(len(registered)))
+        
+        lectures_regist_success = [lec for lec in registered if regist_results.get(lec.aid) == "注册成功"]
+        
+        # The retried lectures were published before, only the ones found by this poll tell when lectures come out.
+        if not first_poll and len(answered) > 0:
+            self.publications.record(len(answered))
+            self.store.save_profile(publications = vars(self.publications))
+        
+        METRICS.observe('poll', time.perf_counter() - poll_begin)
+        METRICS.increment('lectures_new', len(answered))
         
-        self.notice(lectures_regist_success)
+        with METRICS.measure('notification'):
+            self.notice(lectures_regist_success)
         self.locking = False
-        return len(new_lectures), len(lectures_regist_success)
+        return len(registered), len(lectures_regist_success)
+    
+    def route_lectures(self, plan:SearchPlan, lectures:Iterable[Lecture], new_lectures:List[Lecture]) -> Iterator[Tuple[Lecture, float]]:
+        """
+        Pass the lectures of a search to the watches they belong to, 
+        and yield the ones to register, with the highest preference of their watches.
+        
+        If the search is broader than its watches, but the server does not tell the category of the lectures,
+        the searches are no longer merged from the next poll on.
+        """
+        for lec in lectures:
+            with METRICS.measure('filter'):
+                accepted = [watch.accepts(lec, plan.mapping) for watch in plan.watches]
+            
+            if None in accepted and self.broaden_searches:
+                logger.warning("Lectures carry no category, searching each watch on its own from now on.")
+                self.broaden_searches = False
+                
+            if True in accepted and self.sniper is not None and is_not_open(lec):
+                # Not open yet, leave it to the sniper instead of wasting a registration now.
+                self.sniper.schedule(lec)
+                continue
+                
+            if True in accepted and not self.is_checked(lec):
+                # Mark it at once, so a lecture repeated across pages is registered only once.
+                self.mark_checked(lec)
+                new_lectures.append(lec)
+                yield lec, max(watch.preference for watch, accept in zip(plan.watches, accepted) if accept is True)
     
     def save(self):
-        with open(self.save_path, 'wb') as f:
-            pickle.dump(self, f)
+        """
+        Write the account and the publication histogram to the store.
+        The lectures and the cookie are written as they change, so they are never lost on a crash.
+        """
+        self.store.save_profile(user_id      = self.user_id,
+                                passward     = self.passward,
+                                token        = self.token,
+                                captcha      = self.captcha,
+                                captcha_id   = self.captcha_id,
+                                mapping      = self.mapping,
+                                pool_size    = self.pool_size,
+                                publications = vars(self.publications))
+        
+    def save_cookie(self):
+        cookie = self.cookie_maintainer.get_content(force_get = True)
+        
+        if cookie is None or not self.cookie_maintainer.set_content:
+            self.store.save_profile(cookie = None)
+            return
+        
+        # The user agent goes with the cookie, the server saw the session logged in with it.
+        self.store.save_profile(cookie     = {'content': cookie, 'birth_time': self.cookie_maintainer.birth_time.isoformat()},
+                                token      = self.token,
+                                user_agent = self.user_agent)
+        
+    def mark_checked(self, lecture:Lecture):
+        """
+        Add a lecture to the pool, so it is not registered again, and record it in the store.
+        """
+        self.lecture_pool_checked.add(lecture.aid, lecture.regist_end)
+        self.store.add_lecture(lecture.aid, lecture.regist_end)
+    
+    def unmark_checked(self, lectures:List[Lecture], preferences:Dict[str,float] = None):
+        """
+        Take the lectures back out of the pool and the store, and queue them for the next poll,
+        e.g. their registration got no answer from the server.
+        
+        Args:
+            lectures (List[Lecture]): The lectures to try again.
+            preferences (Dict[str,float], optional): The preference of the watch of each aid. Defaults to None, which is 0.0 for all.
+        """
+        preferences = preferences or {}
+        aids = [lec.aid for lec in lectures]
+        
+        for aid in aids:
+            self.lecture_pool_checked.discard(aid)
+        self.store.remove_lectures(aids)
+        
+        with self.retry_lock:
+            for lec in lectures:
+                self.retries[lec.aid] = (lec, preferences.get(lec.aid, 0.0))
+    
+    def take_retries(self) -> List[Tuple[Lecture,float]]:
+        """
+        Hand over the lectures queued by unmark_checked, with the preference of their watch.
+        """
+        with self.retry_lock:
+            retries, self.retries = list(self.retries.values()), {}
+        return retries
             
     def clear_pool(self):
-        for maintainer in list(self.lecture_pool_checked):
-            if maintainer.is_expired():
-                logger.info('Removing Lecture {} from pool'.format(maintainer.get_content(force_get = True)))
-                self.lecture_pool_checked.remove(maintainer)
+        for aid in self.lecture_pool_checked.clear_expired():
+            logger.info('Removing Lecture {} from pool'.format(aid))
+        
+        self.store.compact()
+            
+    def schedule_jobs(self,
+                    scheduler                : schedule.Scheduler,
+                    dispatch                 : Callable  = None,
+                    checking_interval_seconds: int       = 120,
+                    clear_interval_seconds   : int       = 3600,
+                    max_lecture_num          : int       = 30,
+                    lecture_type             : List[str] = ["","",""],
+                    query                    : str       = "",
+                    filter_function          : Callable  = None,
+                    concurrency              : int       = REGIST_CONCURRENCY,
+                    max_pages                : int       = MAX_PAGES,
+                    incremental              : bool      = True,
+                    watches                  : List[Watch] = None,
+                    adaptive                 : bool      = False,
+                    min_interval_seconds     : float     = MIN_INTERVAL,
+                    max_interval_seconds     : float     = MAX_INTERVAL,
+                    snipe                    : bool      = False) -> List[schedule.Job]:
+        """
+        Add the jobs of this spider to a scheduler, which may be shared with other spiders.
+        The parameters are the same as run.
+
+        Args:
+            scheduler (schedule.Scheduler): The scheduler to add the jobs to.
+            dispatch (Callable, optional): called as dispatch(job, *args) to run a job, e.g. in a thread pool. 
+                Defaults to None, which runs the job in the thread of the scheduler.
+                
+        Returns:
+            List[schedule.Job]: The jobs added.
+        """
+        if dispatch is None:
+            dispatch = lambda job, *args: job(*args)
+        
+        if snipe and self.sniper is None:
+            self.enable_snipe()
             
+        # Without any watch given or added, watch the single category of the parameters.
+        if watches is None and len(self.watches) == 0:
+            watches = [Watch(lecture_type, query, filter_function)]
+        
+        check_job = scheduler.every(checking_interval_seconds).seconds
+        
+        def poll():
+            dispatch(self.check_watches, watches, max_lecture_num, concurrency, max_pages, incremental)
+            
+            # The scheduler plans the next run from the interval after the job returns.
+            if adaptive:
+                check_job.interval = adaptive_interval.next_interval()
+                logger.info("Next check in {:.0f} seconds.".format(check_job.interval))
+        
+        if adaptive:
+            adaptive_interval = AdaptiveInterval(self.publications,
+                                                base_interval = checking_interval_seconds,
+                                                min_interval  = min_interval_seconds,
+                                                max_interval  = max_interval_seconds)
+            check_job.interval = adaptive_interval.next_interval()
+        
+        jobs = [
+            check_job.do(poll),
+            scheduler.every(clear_interval_seconds).seconds.do(dispatch, self.clear_pool),
+            scheduler.every(SESSION_CHECK_INTERVAL).seconds.do(self.keep_session)]
+        
+        return jobs
+    
     def run(self,
             checking_interval_seconds: int       = 120,
             clear_interval_seconds   : int       = 3600,
             max_lecture_num          : int       = 30,
             lecture_type             : List[str] = ["","",""],
             query                    : str       = "",
-            filter_function          : Callable  = None
+            filter_function          : Callable  = None,
+            concurrency              : int       = REGIST_CONCURRENCY,
+            max_pages                : int       = MAX_PAGES,
+            incremental              : bool      = True,
+            watches                  : List[Watch] = None,
+            adaptive                 : bool      = False,
+            min_interval_seconds     : float     = MIN_INTERVAL,
+            max_interval_seconds     : float     = MAX_INTERVAL,
+            snipe                    : bool      = False
             ):
+        """
+        Check the lectures every checking_interval_seconds until stop is called.
         
-        schedule.every(checking_interval_seconds).seconds.do(self.check_lecture, max_lecture_num, lecture_type, query, filter_function)
-        schedule.every(clear_interval_seconds).seconds.do(self.clear_pool)
+        The lectures watched are, in order: watches if given, the watches added by add_watch, 
+        or a single watch made of lecture_type, query and filter_function.
+        
+        With adaptive set, the interval follows the hours lectures are usually published in, 
+        between min_interval_seconds and max_interval_seconds, refer to adaptive.AdaptiveInterval.
+        With snipe set, the watched lectures not open yet are registered right at their opening, refer to sniper.Sniper.
+        The rest of the parameters are the same as check_lecture.
+        """
+        
+        self.scheduler.clear()
+        self.schedule_jobs(self.scheduler,
+                            checking_interval_seconds = checking_interval_seconds,
+                            clear_interval_seconds    = clear_interval_seconds,
+                            max_lecture_num           = max_lecture_num,
+                            lecture_type              = lecture_type,
+                            query                     = query,
+                            filter_function           = filter_function,
+                            concurrency               = concurrency,
+                            max_pages                 = max_pages,
+                            incremental               = incremental,
+                            watches                   = watches,
+                            adaptive                  = adaptive,
+                            min_interval_seconds      = min_interval_seconds,
+                            max_interval_seconds      = max_interval_seconds,
+                            snipe                     = snipe)
         
         self.running = True
         
         try:
-            while self.running:
-                schedule.run_pending()
+            serve_scheduler(self.scheduler, self.wake_event, self.is_running)
         except KeyboardInterrupt:
             logger.info("Encounter keyboard interrupt, exiting...")
             self.save()
             
         return
     
+    def wake(self):
+        """
+        Interrupt the sleep of run, e.g. after the jobs of the scheduler are changed.
+        """
+        self.wake_event.set()
+    
     def stop(self):
         self.running = False
+        self.wake()
+        
+        if self.sniper is not None:
+            self.sniper.stop()
 
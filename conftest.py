@@ -0,0 +1,17 @@
+"""
+The fixtures shared by the tests, run them with `python -m pytest`.
+"""
+import pytest
+
+from mock_server import MockCampus
+
+
+@pytest.fixture
+def campus(tmp_path, monkeypatch):
+    # The user agent cache is written to the working directory.
+    monkeypatch.chdir(tmp_path)
+
+    campus = MockCampus()
+    campus.start()
+    yield campus
+    campus.stop()
@@ -1,13 +1,11 @@
 import sys
-from typing import List, Dict, Callable, Literal, NewType
+import importlib
+from typing import List, Dict, Callable, Literal, NewType, Union, Iterator
 
 Methods = Literal['Void','Toaster','WxPusher']
 
 from loguru import logger
 
-from windows_toasts import Toast, WindowsToaster
-from windows_toasts.wrappers import ToastDisplayImage
-
 LOGGER_FORMAT = '<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> ' \
             '| <cyan>{name}</cyan>:<cyan>{function: >20}</cyan>:<yellow>{line: >4}</yellow> - <level>{message}</level>'
             
@@ -146,21 +144,52 @@ ALIAS:Dict[str,int] = {
     "生命与环境":142
 }
 
-def toast_notifier(lectures:List[Dict]):
-    toast_content = '\n'.join([f'Lecture {lec["aid"]} succesfully registered' for lec in lectures])
-    toast_content += '\nClick to open website for first lecture.'
-    toaster = WindowsToaster('RUC Lecture Notifier')
-    newToast = Toast()
-    newToast.text_fields = [toast_content]
-    newToast.AddImage(ToastDisplayImage.fromPath('./RUCWeb.ico'))
-    newToast.launch_action = 'https://v.ruc.edu.cn//campus#/activity/partakedetail/{aid}/description'.format(aid = lectures[0]['aid'])
-    toaster.show_toast(newToast)
+class NotifierRegistry(object):
+    '''
+    The notifier backends by name. A backend is called with the lectures registered.
+    
+    A backend may be registered as the path 'module:function' of one, 
+    so the module and what it depends on (e.g. windows_toasts) is only imported when the backend is first used.
+    '''
+    
+    def __init__(self):
+        self.backends:Dict[str,Union[Callable,str]] = {}
+        
+    def __repr__(self) -> str:
+        return f'NotifierRegistry of {", ".join(self.backends)}'
+        
+    def __contains__(self, name:str) -> bool:
+        return name in self.backends
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.backends)
+        
+    def register(self, name:str, backend:Union[Callable,str] = None):
+        """
+        Register a backend, or used as a decorator if backend is not given.
+        """
+        if backend is None:
+            return lambda function: self.register(name, function)
+        
+        self.backends[name] = backend
+        return backend
+    
+    def __getitem__(self, name:str) -> Callable:
+        backend = self.backends[name]
+        
+        if isinstance(backend, str):
+            module_name, _, function_name = backend.partition(':')
+            backend = getattr(importlib.import_module(module_name), function_name)
+            self.backends[name] = backend
+            
+        return backend
 
 
-NOTIFIER:Dict[str,Callable] = {
-    'none': lambda lectures: None,
-    'toast': toast_notifier
-}
+NOTIFIER = NotifierRegistry()
+NOTIFIER.register('none', lambda lectures: None)
+NOTIFIER.register('toast', 'notifiers:toast_notifier')
+NOTIFIER.register('Void', NOTIFIER.backends['none'])
+NOTIFIER.register('Toaster', 'notifiers:toast_notifier')
 
 
 DEFAULT_LECTURE = ["素质拓展认证","形势与政策","形势与政策讲座"]
@@ -0,0 +1,172 @@
+"""
+Callbacks around every request sent by components.query_html, to observe or adjust the traffic without patching it.
+
+>>> @HOOKS.register('after_response')
+... def log_slow(info, response):
+...     if info.seconds > 1:
+...         print(info.endpoint, info.seconds)
+"""
+import time
+import threading
+from urllib.parse import urlparse
+from typing import Dict, Any, List, Callable, Union
+
+from loguru import logger
+
+EVENTS = ('before_request', 'after_response', 'on_retry', 'on_error')
+
+
+def payload_size(kwargs:Dict[str, Any]) -> int:
+    """
+    The size of the body to send, close enough for profiling. A json body is measured by its repr.
+    """
+    body = kwargs.get('data') or kwargs.get('json')
+
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    return len(repr(body))
+
+
+class RequestInfo(object):
+    '''
+    One request on its way through query_html.
+
+    `kwargs` are the parameters passed to requests, a before_request hook may change them, e.g. add a header.
+    The timing, the status and the sizes are filled when the response arrives or the request fails.
+    '''
+
+    def __init__(self, method:str, kwargs:Dict[str, Any], attempt:int = 1):
+        self.method = method
+        self.kwargs = kwargs
+        self.attempt = attempt
+
+        self.url:str = kwargs.get('url', '')
+        self.endpoint:str = urlparse(self.url).path
+        self.request_bytes:int = payload_size(kwargs)
+
+        self.begin = time.perf_counter()
+        self.seconds:float = 0.0
+        self.status:int = None
+        self.response_bytes:int = 0
+        self.error:BaseException = None
+
+    def __repr__(self) -> str:
+        return f'{self.method} {self.endpoint} #{self.attempt}'
+
+    def finish(self, response = None, error:BaseException = None):
+        self.seconds = time.perf_counter() - self.begin
+        self.error = error
+
+        if response is not None:
+            self.status = response.status_code
+            # A streamed body is still on the way, reading it here would wait for all of it.
+            if self.kwargs.get('stream'):
+                self.response_bytes = int(response.headers.get('Content-Length', 0))
+            else:
+                self.response_bytes = len(response.content)
+
+
+class RequestHooks(object):
+    '''
+    The callbacks of each event, in the order registered:
+
+    - before_request(info): before the request is sent.
+    - after_response(info, response): after a response arrives, whatever its status.
+    - on_error(info, error): when sending the request raises.
+    - on_retry(info, error): when a failed request is about to be sent again.
+
+    A callback raising is logged and skipped, it never breaks the request.
+    '''
+
+    def __init__(self):
+        self.callbacks:Dict[str, List[Callable]] = {event: [] for event in EVENTS}
+        self.lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return 'RequestHooks of ' + ', '.join(f'{len(callbacks)} {event}' for event, callbacks in self.callbacks.items())
+
+    def register(self, event:str, callback:Callable = None) -> Union[Callable, None]:
+        """
+        Add a callback to an event, or used as a decorator if callback is not given.
+        """
+        assert event in EVENTS, f"event should be one of {EVENTS}"
+
+        if callback is None:
+            return lambda function: self.register(event, function)
+
+        with self.lock:
+            # Replaced rather than appended to, so a request being sent is not affected.
+            self.callbacks[event] = self.callbacks[event] + [callback]
+
+        return callback
+
+    def unregister(self, event:str, callback:Callable):
+        with self.lock:
+            self.callbacks[event] = [registered for registered in self.callbacks[event] if registered is not callback]
+
+    def emit(self, event:str, *args):
+        for callback in self.callbacks[event]:
+            try:
+                callback(*args)
+            except Exception:
+                logger.exception("Hook {} of {} failed.".format(getattr(callback, '__name__', callback), event))
+
+    def retry_callback(self, retry_state):
+        """
+        The before_sleep callback of tenacity, which tells the on_retry hooks.
+        """
+        kwargs = retry_state.kwargs
+        method = kwargs.get('method', retry_state.args[0] if len(retry_state.args) > 0 else 'GET')
+
+        info = RequestInfo(method, kwargs, attempt = retry_state.attempt_number)
+        self.emit('on_retry', info, retry_state.outcome.exception())
+
+
+class EndpointProfiler(object):
+    '''
+    A built-in hook counting, per endpoint, the requests, the failures, the time and the bytes both ways.
+    '''
+
+    def __init__(self):
+        self.stats:Dict[str, Dict[str, float]] = {}
+        self.lock = threading.Lock()
+
+    def install(self, hooks:RequestHooks) -> 'EndpointProfiler':
+        hooks.register('after_response', self.after_response)
+        hooks.register('on_error', self.on_error)
+        return self
+
+    def uninstall(self, hooks:RequestHooks):
+        hooks.unregister('after_response', self.after_response)
+        hooks.unregister('on_error', self.on_error)
+
+    def record(self, info:RequestInfo):
+        with self.lock:
+            stats = self.stats.setdefault(f'{info.method} {info.endpoint}',
+                                        {'requests': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                         'request_bytes': 0, 'response_bytes': 0})
+            stats['requests'] += 1
+            stats['errors'] += int(info.error is not None or (info.status or 0) >= 400)
+            stats['seconds'] += info.seconds
+            stats['max_seconds'] = max(stats['max_seconds'], info.seconds)
+            stats['request_bytes'] += info.request_bytes
+            stats['response_bytes'] += info.response_bytes
+
+    def after_response(self, info:RequestInfo, response):
+        self.record(info)
+
+    def on_error(self, info:RequestInfo, error:BaseException):
+        self.record(info)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """
+        The stats of each endpoint, with the mean time in milliseconds.
+        """
+        with self.lock:
+            return {endpoint: {**stats, 'mean_ms': stats['seconds'] / stats['requests'] * 1000}
+                    for endpoint, stats in self.stats.items()}
+
+
+HOOKS = RequestHooks()
@@ -0,0 +1,284 @@
+"""
+The lectures of a search response, parsed once into compact records.
+
+A response holds tens of lectures of a dozen fields each, most of which the spider never reads.
+Lecture parses only the fields it uses, with the times parsed once. The raw dict is kept only on demand,
+for the custom filters which may read any field of the server.
+
+A response may also be decoded as it downloads, by stream_lectures, so each lecture is handed on as soon as it arrives.
+"""
+import json
+import codecs
+from datetime import datetime
+from json.decoder import scanstring
+from typing import Dict, Any, List, Tuple, Union, Iterable, Iterator
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+LECTURES_PATH = ('data', 'data')
+# The seats of a lecture, and the ones taken.
+SEATS_FIELD = 'maxnum'
+TAKEN_FIELD = 'registnum'
+WHITESPACE = ' \t\n\r'
+
+
+def parse_time(text:str) -> Union[datetime, None]:
+    """
+    Parse a time of the server, e.g. '2024-05-01 08:00:00'. fromisoformat is a lot faster than strptime.
+    """
+    if not text:
+        return None
+
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return datetime.strptime(text, TIME_FORMAT)
+
+
+def normalize_aid(aid:Union[str, int]) -> str:
+    """
+    The server sends aid either as str or int, both are normalised to str.
+    """
+    aid = str(aid).strip()
+    return str(int(aid)) if aid.isdigit() else aid
+
+
+def parse_category(value:Any) -> Union[int, None]:
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def fingerprint_of(aid:str, lecture:Dict[str, Any]) -> int:
+    """
+    A hash of every field of the server but the seats taken, which change at each registration.
+    """
+    fields = tuple((key, value) for key, value in lecture.items() if key not in ('aid', TAKEN_FIELD))
+
+    try:
+        return hash((aid, fields))
+    except TypeError:
+        # A nested value, e.g. a list, is not hashable.
+        return hash((aid, json.dumps(fields, ensure_ascii = False, default = str)))
+
+
+def parse_seats_left(lecture:Dict[str, Any]) -> Union[int, None]:
+    if lecture.get(SEATS_FIELD) in (None, '') or lecture.get(TAKEN_FIELD) in (None, ''):
+        return None
+    return max(int(lecture[SEATS_FIELD]) - int(lecture[TAKEN_FIELD]), 0)
+
+
+class Lecture(object):
+    '''
+    A lecture of a search response, with the fields the spider uses.
+
+    Made with keep_raw, it still answers lecture["location"] and lecture.get("title") from the raw dict of the server,
+    so the filters written for the dicts keep working, whatever field they read.
+    Otherwise it answers the fields of to_dict only.
+    '''
+
+    __slots__ = ('aid', 'title', 'applyscore', 'regist_begin', 'regist_end', 'typelevels', 'seats_left', 'fingerprint', 'raw')
+
+    def __init__(self,
+                aid         : str,
+                title       : str                         = '',
+                applyscore  : Any                         = None,
+                regist_begin: datetime                    = None,
+                regist_end  : datetime                    = None,
+                typelevels  : Tuple[Union[int, None], ...] = (None, None, None),
+                seats_left  : int                         = None,
+                raw         : Dict[str, Any]              = None,
+                fingerprint : int                         = None):
+        self.aid = aid
+        self.title = title
+        self.applyscore = applyscore
+        self.regist_begin = regist_begin
+        self.regist_end = regist_end
+        self.typelevels = typelevels
+        self.seats_left = seats_left
+        self.raw = raw
+        # A lecture is considered changed if any of the fields kept changes, but the seats, taken at each registration.
+        self.fingerprint = hash((aid, title, applyscore, regist_begin, regist_end, typelevels)) if fingerprint is None else fingerprint
+
+    @classmethod
+    def from_dict(cls, lecture:Dict[str, Any], keep_raw:bool = False) -> 'Lecture':
+        """
+        Args:
+            lecture (Dict[str, Any]): A lecture of the server.
+            keep_raw (bool, optional): keep the dict, so every field can be read by lecture["..."]. Defaults to False.
+        """
+        aid = normalize_aid(lecture['aid'])
+
+        return cls(aid          = aid,
+                    title        = lecture.get('title', ''),
+                    applyscore   = lecture.get('applyscore'),
+                    regist_begin = parse_time(lecture.get('registbegintime')),
+                    regist_end   = parse_time(lecture.get('registendtime')),
+                    typelevels   = (parse_category(lecture.get('typelevel1')),
+                                    parse_category(lecture.get('typelevel2')),
+                                    parse_category(lecture.get('typelevel3'))),
+                    seats_left   = parse_seats_left(lecture),
+                    raw          = lecture if keep_raw else None,
+                    # Every field counts, a filter may read any of them.
+                    fingerprint  = fingerprint_of(aid, lecture))
+
+    def __repr__(self) -> str:
+        return f'Lecture {self.aid} {self.title}'
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Lecture) and self.fingerprint == other.fingerprint and self.aid == other.aid
+
+    def __hash__(self) -> int:
+        return self.fingerprint
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.raw is not None:
+            return dict(self.raw)
+
+        lecture = {'aid'            : self.aid,
+                    'title'          : self.title,
+                    'applyscore'     : self.applyscore,
+                    'registbegintime': self.regist_begin.strftime(TIME_FORMAT) if self.regist_begin else None,
+                    'registendtime'  : self.regist_end.strftime(TIME_FORMAT) if self.regist_end else None}
+
+        for level, category in enumerate(self.typelevels):
+            if category is not None:
+                lecture[f'typelevel{level + 1}'] = category
+
+        return lecture
+
+    def get(self, key:str, default:Any = None) -> Any:
+        if self.raw is None:
+            return self.to_dict().get(key, default)
+        return self.raw.get(key, default)
+
+    def __getitem__(self, key:str) -> Any:
+        if self.raw is None:
+            return self.to_dict()[key]
+        return self.raw[key]
+
+
+def parse_lectures(body:Union[bytes, str], keep_raw:bool = False) -> List[Lecture]:
+    """
+    Decode a response of /campus/v2/search into lectures, with orjson if it is installed.
+    """
+    return [Lecture.from_dict(lecture, keep_raw) for lecture in json_loads(body)['data']['data']]
+
+
+class ArrayStream(object):
+    '''
+    Decode the items of the array at `path` of a json document, fed chunk by chunk as it downloads.
+
+    Only the item being decoded is buffered, so the memory does not grow with the array.
+    The document is expected to be an object, and the path made of its keys, e.g. ('data', 'data').
+    '''
+
+    def __init__(self, path:Tuple[str, ...] = LECTURES_PATH):
+        self.path = list(path)
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+
+        # The keys leading to the containers opened so far, and the last key read.
+        self.keys:List[str] = []
+        self.key:str = None
+
+        self.in_array = False
+        self.done = False
+
+    def feed(self, chunk:bytes) -> List[Any]:
+        """
+        Add a chunk of the document, and return the items completed by it.
+        """
+        if self.done:
+            return []
+
+        self.buffer += self.text_decoder.decode(chunk)
+        items = []
+        position = 0
+
+        while position < len(self.buffer):
+            if self.in_array:
+                while position < len(self.buffer) and self.buffer[position] in WHITESPACE + ',':
+                    position += 1
+                if position == len(self.buffer):
+                    break
+
+                if self.buffer[position] == ']':
+                    self.done = True
+                    position += 1
+                    break
+
+                try:
+                    item, position = self.decoder.raw_decode(self.buffer, position)
+                except json.JSONDecodeError:
+                    # The item is cut by the end of the chunk, wait for the next one.
+                    break
+
+                items.append(item)
+                continue
+
+            char = self.buffer[position]
+
+            if char == '"':
+                try:
+                    text, end = scanstring(self.buffer, position + 1)
+                except json.JSONDecodeError:
+                    break
+
+                # A string is a key if a colon follows it, which may still be on the way.
+                after = end
+                while after < len(self.buffer) and self.buffer[after] in WHITESPACE:
+                    after += 1
+                if after == len(self.buffer):
+                    break
+                if self.buffer[after] == ':':
+                    self.key = text
+
+                position = end
+            elif char == '[' and len(self.keys) > 0 and self.keys[1:] + [self.key] == self.path:
+                self.in_array = True
+                position += 1
+            elif char in '{[':
+                self.keys.append(self.key)
+                self.key = None
+                position += 1
+            elif char in '}]':
+                if len(self.keys) > 0:
+                    self.keys.pop()
+                self.key = None
+                position += 1
+            else:
+                position += 1
+
+        self.buffer = self.buffer[position:]
+        return items
+
+    def close(self):
+        """
+        Check the document had the array, after the last chunk.
+        """
+        if not self.done:
+            raise ValueError("The response has no complete array at {}".format('.'.join(self.path)))
+
+
+def stream_lectures(chunks:Iterable[bytes], keep_raw:bool = False) -> Iterator[Lecture]:
+    """
+    Decode a response of /campus/v2/search chunk by chunk, e.g. from response.iter_content(),
+    and yield each lecture as soon as it is complete.
+    """
+    stream = ArrayStream(LECTURES_PATH)
+
+    for chunk in chunks:
+        for lecture in stream.feed(chunk):
+            yield Lecture.from_dict(lecture, keep_raw)
+
+        if stream.done:
+            return
+
+    stream.close()
@@ -1,7 +1,8 @@
 
 import atexit
 from getpass import getpass
-from components import RUCSpider
+from components import RUCSpider, OCR_ENGINE
+from metrics import METRICS
 
 from constants import DEFAULT_LECTURE
 
@@ -9,9 +10,12 @@ def save_spider(spider):
     spider.save()
 
 def main():
+    OCR_ENGINE.preload()
     spider = RUCSpider()
     
     atexit.register(save_spider, spider)
+    # METRICS.serve(port = 9108)             # serve the metrics at http://127.0.0.1:9108/metrics
+    # METRICS.write_every('./metrics.json')  # or write them to a file every 15 seconds
     # spider.user_id = '20xx'
     # spider.passward = '[Your password]'
     
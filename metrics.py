@@ -0,0 +1,204 @@
+"""
+Counters and latency histograms of the phases of a poll, shared by every spider of the process.
+
+They are read from METRICS.snapshot(), served in the Prometheus text format by METRICS.serve(port),
+or written to a json file by METRICS.write_every(path).
+"""
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Iterator, Union
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from loguru import logger
+
+PREFIX = 'rucspider'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WRITE_INTERVAL = 15
+
+PHASES = ('token', 'captcha', 'ocr', 'login', 'search', 'filter', 'registration', 'notification', 'poll')
+
+
+class PhaseMetric(object):
+    '''
+    The calls of one phase: how many, how many failed, and how long they took in a cumulative histogram.
+    '''
+
+    def __init__(self, buckets:Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts:List[int] = [0] * len(buckets)
+        self.count:int = 0
+        self.errors:int = 0
+        self.sum:float = 0.0
+        self.max:float = 0.0
+
+    def observe(self, seconds:float, error:bool = False):
+        self.count += 1
+        self.errors += int(error)
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.bucket_counts[index] += 1
+
+    def to_dict(self) -> Dict[str, Union[int, float, Dict]]:
+        return {'count'      : self.count,
+                'errors'     : self.errors,
+                'sum_seconds': self.sum,
+                'mean_ms'    : self.sum / self.count * 1000 if self.count > 0 else 0.0,
+                'max_ms'     : self.max * 1000,
+                'buckets'    : {str(bound): count for bound, count in zip(self.buckets, self.bucket_counts)}}
+
+
+class Metrics(object):
+    '''
+    The registry of the phase metrics, the plain counters and the gauges. It is safe to update from any thread.
+    '''
+
+    def __init__(self):
+        self.phases:Dict[str, PhaseMetric] = {phase: PhaseMetric() for phase in PHASES}
+        self.counters:Dict[str, float] = {}
+        self.gauges:Dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def __repr__(self) -> str:
+        return f'Metrics of {len(self.phases)} phase(s) and {len(self.counters)} counter(s)'
+
+    def observe(self, phase:str, seconds:float, error:bool = False):
+        with self.lock:
+            self.phases.setdefault(phase, PhaseMetric()).observe(seconds, error)
+
+    @contextmanager
+    def measure(self, phase:str) -> Iterator[None]:
+        """
+        Time the block as one call of `phase`. An exception leaving the block counts as an error.
+        """
+        begin = time.perf_counter()
+
+        try:
+            yield
+        except BaseException:
+            self.observe(phase, time.perf_counter() - begin, error = True)
+            raise
+
+        self.observe(phase, time.perf_counter() - begin)
+
+    def increment(self, name:str, value:float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name:str, value:float):
+        with self.lock:
+            self.gauges[name] = value
+
+    def reset(self):
+        with self.lock:
+            self.phases = {phase: PhaseMetric() for phase in PHASES}
+            self.counters = {}
+            self.gauges = {}
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self.lock:
+            return {'time'    : datetime.now().isoformat(),
+                    'phases'  : {phase: metric.to_dict() for phase, metric in self.phases.items()},
+                    'counters': dict(self.counters),
+                    'gauges'  : dict(self.gauges)}
+
+    def to_prometheus(self) -> str:
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        lines = [f'# HELP {PREFIX}_phase_seconds The time spent in each phase of a poll.',
+                f'# TYPE {PREFIX}_phase_seconds histogram']
+
+        with self.lock:
+            for phase, metric in self.phases.items():
+                for bound, count in zip(metric.buckets, metric.bucket_counts):
+                    lines.append(f'{PREFIX}_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {count}')
+                lines.append(f'{PREFIX}_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} {metric.count}')
+                lines.append(f'{PREFIX}_phase_seconds_sum{{phase="{phase}"}} {metric.sum}')
+                lines.append(f'{PREFIX}_phase_seconds_count{{phase="{phase}"}} {metric.count}')
+
+            lines.append(f'# HELP {PREFIX}_phase_errors_total The calls of each phase which failed.')
+            lines.append(f'# TYPE {PREFIX}_phase_errors_total counter')
+            for phase, metric in self.phases.items():
+                lines.append(f'{PREFIX}_phase_errors_total{{phase="{phase}"}} {metric.errors}')
+
+            for name, value in self.counters.items():
+                lines.append(f'# TYPE {PREFIX}_{name}_total counter')
+                lines.append(f'{PREFIX}_{name}_total {value}')
+
+            for name, value in self.gauges.items():
+                lines.append(f'# TYPE {PREFIX}_{name} gauge')
+                lines.append(f'{PREFIX}_{name} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path:str):
+        # Write aside and rename, so a reader never sees a half-written file.
+        with open(path + '.tmp', 'w', encoding = 'utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii = False, indent = 1)
+        os.replace(path + '.tmp', path)
+
+    def write_every(self, path:str, interval:float = WRITE_INTERVAL) -> threading.Thread:
+        """
+        Write the snapshot to `path` every `interval` seconds in a daemon thread, until stop is called.
+        """
+        def write():
+            while not self.stop_event.wait(interval):
+                try:
+                    self.write_json(path)
+                except OSError as e:
+                    logger.warning("Fail to write the metrics to {}: {}".format(path, e))
+
+        thread = threading.Thread(target = write, daemon = True)
+        thread.start()
+        return thread
+
+    def serve(self, port:int = 9108, host:str = '127.0.0.1') -> ThreadingHTTPServer:
+        """
+        Serve the metrics at http://host:port/metrics in a daemon thread, for Prometheus to scrape.
+
+        Returns:
+            ThreadingHTTPServer: The server, call shutdown() on it to stop.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] == '/metrics':
+                    body, content_type = metrics.to_prometheus(), 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path.split('?')[0] == '/metrics.json':
+                    body, content_type = json.dumps(metrics.snapshot(), ensure_ascii = False), 'application/json; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target = server.serve_forever, daemon = True).start()
+
+        logger.info("Serving metrics at http://{}:{}/metrics".format(*server.server_address[:2]))
+        return server
+
+    def stop(self):
+        self.stop_event.set()
+
+
+METRICS = Metrics()
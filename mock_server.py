@@ -0,0 +1,348 @@
+"""
+A local stand-in of v.ruc.edu.cn, answering the same endpoints with the same json shapes components.py parses.
+
+It is meant for benchmarks and checks, so the spider can run without the real server:
+
+>>> campus = MockCampus(latency = 0.05, error_rate = 0.1)
+>>> campus.publish_every(30, count = 5)
+>>> campus.start()
+>>> spider = make_spider(campus.base_url)
+"""
+import json
+import time
+import hashlib
+import random
+import secrets
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple, Union
+from urllib.parse import urlparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from components import RUCSpider
+
+# A 1x1 white png, the OCR result does not matter to the mock.
+CAPTCHA_IMAGE = 'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGP4//8/AAX+Av4N70a4AAAAAElFTkSuQmCC'
+
+TOKEN_PAGE = '<html><body><form><input type="hidden" name="csrftoken" value="{token}" id="csrftoken" /></form></body></html>'
+
+SESSION_COOKIE = 'session'
+BANDWIDTH_CHUNK = 4096
+
+
+class MockCampus(object):
+    '''
+    The state of the mock server: the lectures published, the sessions issued and the requests received.
+
+    The lectures are published by schedule, relative to the time the server starts.
+    '''
+
+    def __init__(self,
+                host              : str   = '127.0.0.1',
+                port              : int   = 0,
+                latency           : float = 0.0,
+                error_rate        : float = 0.0,
+                captcha_error_rate: float = 0.0,
+                bandwidth         : float = None,
+                auth_error_json   : bool  = False,
+                content_length    : bool  = True):
+        """
+        Args:
+            host (str, optional): The host to listen on. Defaults to '127.0.0.1'.
+            port (int, optional): The port to listen on, 0 picks a free one. Defaults to 0.
+            latency (float, optional): The seconds each response is delayed. Defaults to 0.0.
+            error_rate (float, optional): The chance of answering a non-json 503. Defaults to 0.0.
+            captcha_error_rate (float, optional): The chance of refusing a login with 'captcha error'. Defaults to 0.0.
+            bandwidth (float, optional): The bytes per second each body is sent at, None for no limit. Defaults to None.
+            auth_error_json (bool, optional): Refuse a dropped session with a 200 and an auth error json,
+                instead of a redirect to the login page. Defaults to False.
+            content_length (bool, optional): Send the Content-Length of the bodies. 
+                False ends them by closing the connection, as the client sees a chunked reply. Defaults to True.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.captcha_error_rate = captcha_error_rate
+        self.bandwidth = bandwidth
+        self.auth_error_json = auth_error_json
+        self.content_length = content_length
+        # Answer the searches with this json instead of the lectures, e.g. an error of the server.
+        self.search_reply:Dict = None
+
+        self.lock = threading.Lock()
+        self.schedule:List[Tuple[float, Dict]] = []
+        self.sessions:set = set()
+        self.next_aid = 10000
+
+        self.requests:Counter = Counter()
+        self.first_seen:Dict[str,float] = {}
+        self.registrations:Dict[str,List[float]] = {}
+        self.opening:Dict[str,float] = {}
+        self.early:Counter = Counter()
+        # The aids refused as full once open.
+        self.full:set = set()
+        self.searches = 0
+
+        self.start_time = time.perf_counter()
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def now(self) -> float:
+        return time.perf_counter() - self.start_time
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.thread = threading.Thread(target = self.server.serve_forever, daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def expire_sessions(self):
+        """
+        Drop every session, as the server does when it invalidates cookies early.
+        """
+        with self.lock:
+            self.sessions.clear()
+
+    def make_lecture(self, regist_seconds:int = 3600, opens_in:float = 0.0) -> Dict[str, Union[str,int]]:
+        """
+        Make a lecture whose registration opens `opens_in` seconds from now, and lasts `regist_seconds`.
+        """
+        with self.lock:
+            self.next_aid += 1
+            aid = self.next_aid
+
+        begin = datetime.now() + timedelta(seconds = opens_in)
+
+        return {'aid'            : aid,
+                'title'          : f'Mock lecture {aid}',
+                'applyscore'     : 1,
+                'registbegintime': begin.strftime('%Y-%m-%d %H:%M:%S'),
+                'registendtime'  : (begin + timedelta(seconds = regist_seconds)).strftime('%Y-%m-%d %H:%M:%S'),
+                'maxnum'         : 100,
+                'registnum'      : 0}
+
+    def publish(self, at:float, lecture:Dict = None) -> Dict:
+        """
+        Publish a lecture `at` seconds after the server starts.
+        """
+        if lecture is None:
+            lecture = self.make_lecture()
+
+        with self.lock:
+            self.schedule.append((at, lecture))
+            self.opening[str(lecture['aid'])] = datetime.strptime(lecture['registbegintime'], '%Y-%m-%d %H:%M:%S').timestamp()
+            self.schedule.sort(key = lambda item: item[0])
+
+        return lecture
+
+    def publish_every(self, interval:float, count:int, first:float = 0.0) -> List[Dict]:
+        return [self.publish(first + index * interval) for index in range(count)]
+
+    def published(self) -> List[Dict]:
+        """
+        The lectures published so far, the newest first as the real server does.
+        """
+        now = self.now()
+
+        with self.lock:
+            return [lecture for at, lecture in reversed(self.schedule) if at <= now]
+
+    def registration_latencies(self) -> Dict[str, float]:
+        """
+        The seconds between a lecture first appearing in a search response and its first registration.
+        """
+        return {aid: times[0] - self.first_seen[aid]
+                for aid, times in self.registrations.items() if aid in self.first_seen}
+
+    def make_handler(self):
+        campus = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_body(self, body:Union[str, Dict], status:int = 200, headers:Dict[str,str] = None):
+                if isinstance(body, dict):
+                    body = json.dumps(body, ensure_ascii = False)
+                    content_type = 'application/json; charset=utf-8'
+                else:
+                    content_type = 'text/html; charset=utf-8'
+
+                data = body.encode('utf-8')
+
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                if campus.content_length:
+                    self.send_header('Content-Length', str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+
+                if campus.bandwidth is None:
+                    self.wfile.write(data)
+                    return
+
+                # Trickle the body, as a large page arrives over a slow link.
+                for begin in range(0, len(data), BANDWIDTH_CHUNK):
+                    self.wfile.write(data[begin: begin + BANDWIDTH_CHUNK])
+                    self.wfile.flush()
+                    time.sleep(BANDWIDTH_CHUNK / campus.bandwidth)
+
+            def read_json(self) -> Dict:
+                length = int(self.headers.get('Content-Length', 0))
+                if length == 0:
+                    return {}
+                return json.loads(self.rfile.read(length))
+
+            def is_logged_in(self) -> bool:
+                cookies = self.headers.get('Cookie', '')
+                for item in cookies.split(';'):
+                    key, _, value = item.strip().partition('=')
+                    if key == SESSION_COOKIE and value in campus.sessions:
+                        return True
+                return False
+
+            def begin(self) -> bool:
+                """
+                Count the request and play the latency and errors. Returns False if an error is sent.
+                """
+                path = urlparse(self.path).path
+                campus.requests[f'{self.command} {path}'] += 1
+
+                if campus.latency > 0:
+                    time.sleep(campus.latency)
+
+                if random.random() < campus.error_rate:
+                    self.send_body('Service Unavailable', status = 503)
+                    return False
+
+                return True
+
+            def do_GET(self):
+                if not self.begin():
+                    return
+
+                path = urlparse(self.path).path
+
+                if path == '/auth/login':
+                    self.send_body(TOKEN_PAGE.format(token = secrets.token_hex(8)))
+                elif path == '/auth/captcha':
+                    self.send_body({'id': secrets.token_hex(8),
+                                    'b64s': 'data:image/png;base64,' + CAPTCHA_IMAGE})
+                else:
+                    self.send_body('Not Found', status = 404)
+
+            def do_POST(self):
+                if not self.begin():
+                    return
+
+                path = urlparse(self.path).path
+                params = self.read_json()
+
+                if path == '/auth/login':
+                    if random.random() < campus.captcha_error_rate:
+                        self.send_body({'error_description': 'captcha error'}, status = 400)
+                        return
+
+                    session = secrets.token_hex(16)
+                    with campus.lock:
+                        campus.sessions.add(session)
+                    self.send_body('<html>ok</html>', headers = {'Set-Cookie': f'{SESSION_COOKIE}={session}; Path=/'})
+                    return
+
+                if not self.is_logged_in() and campus.auth_error_json:
+                    self.send_body({'code': 401, 'msg': '未登录'})
+                    return
+
+                if not self.is_logged_in():
+                    self.send_response(302)
+                    self.send_header('Location', '/auth/login')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                if path == '/campus/v2/search' and campus.search_reply is not None:
+                    self.send_body(campus.search_reply)
+                elif path == '/campus/v2/search':
+                    perpage = int(params.get('perpage', 30))
+                    page = int(params.get('page', 1))
+
+                    # Lectures published with a category are filtered by it, as the real server does.
+                    lectures = [lecture for lecture in campus.published()
+                                if all(int(params.get(f'typelevel{level}', 0)) in (0, lecture.get(f'typelevel{level}', 0))
+                                       for level in (1, 2, 3))]
+                    lectures = lectures[(page - 1) * perpage: page * perpage]
+
+                    now = campus.now()
+                    with campus.lock:
+                        campus.searches += 1
+                        for lecture in lectures:
+                            campus.first_seen.setdefault(str(lecture['aid']), now)
+
+                    body = json.dumps({'data': {'data': lectures}}, ensure_ascii = False)
+                    etag = '"{}"'.format(hashlib.sha1(body.encode('utf-8')).hexdigest())
+
+                    if self.headers.get('If-None-Match') == etag:
+                        self.send_response(304)
+                        self.send_header('ETag', etag)
+                        self.end_headers()
+                        return
+
+                    self.send_body({'data': {'data': lectures}}, headers = {'ETag': etag})
+                elif path == '/campus/Regist/regist':
+                    aid = str(params.get('aid'))
+
+                    if time.time() < campus.opening.get(aid, 0):
+                        with campus.lock:
+                            campus.early[aid] += 1
+                        self.send_body({'msg': '报名未开始'})
+                        return
+
+                    if aid in campus.full:
+                        self.send_body({'msg': '报名人数已满'})
+                        return
+
+                    with campus.lock:
+                        campus.registrations.setdefault(aid, []).append(campus.now())
+
+                    self.send_body({'msg': '注册成功'})
+                else:
+                    self.send_body('Not Found', status = 404)
+
+        return Handler
+
+
+if __name__ == '__main__':
+    campus = MockCampus(port = 8000)
+    campus.publish_every(60, count = 10)
+    campus.start()
+
+    print(f'Mock campus running at {campus.base_url}, press Ctrl+C to stop.')
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        campus.stop()
+
+
+def make_spider(base_url:str) -> RUCSpider:
+    """
+    A spider logged in to the mock campus at `base_url`. The captcha is set by hand, the mock accepts any.
+    """
+    spider = RUCSpider(load_path = None, base_url = base_url)
+    spider.set_user('mock', 'mock')
+    spider.set_captcha('mock', 'mock')
+    spider.refresh_cookie()
+
+    return spider
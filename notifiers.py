@@ -0,0 +1,21 @@
+"""
+The notifier backends needing extra packages. They are registered by path in constants.NOTIFIER,
+so this module is only imported when one of them is used.
+"""
+from typing import List
+
+from windows_toasts import Toast, WindowsToaster
+from windows_toasts.wrappers import ToastDisplayImage
+
+from lecture import Lecture
+
+
+def toast_notifier(lectures:List[Lecture]):
+    toast_content = '\n'.join([f'Lecture {lec.aid} succesfully registered' for lec in lectures])
+    toast_content += '\nClick to open website for first lecture.'
+    toaster = WindowsToaster('RUC Lecture Notifier')
+    newToast = Toast()
+    newToast.text_fields = [toast_content]
+    newToast.AddImage(ToastDisplayImage.fromPath('./RUCWeb.ico'))
+    newToast.launch_action = 'https://v.ruc.edu.cn//campus#/activity/partakedetail/{aid}/description'.format(aid = lectures[0].aid)
+    toaster.show_toast(newToast)
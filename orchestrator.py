@@ -0,0 +1,143 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from typing import Dict, Tuple, Callable
+
+import schedule
+from loguru import logger
+from requests.adapters import HTTPAdapter
+
+from components import RUCSpider, serve_scheduler
+from components import BASE_URL, POOL_SIZE
+
+
+class Orchestrator(object):
+    '''
+    This class hosts the spiders of many accounts in a single process.
+
+    Each account keeps its own cookie, lecture pool and save file.
+    The scheduler, the connection pool and the OCR engine are shared by all of them.
+    '''
+
+    def __init__(self,
+                state_dir  : str = './spiders',
+                pool_size  : int = POOL_SIZE,
+                max_workers: int = 4,
+                base_url   : str = BASE_URL):
+        """
+        Args:
+            state_dir (str, optional): The folder holding the save file of each account. Defaults to './spiders'.
+            pool_size (int, optional): The size of the shared connection pool. Defaults to POOL_SIZE.
+            max_workers (int, optional): The max number of jobs running at the same time. Defaults to 4.
+            base_url (str, optional): The server to talk to. Defaults to BASE_URL.
+        """
+        self.state_dir = state_dir
+        self.base_url = base_url
+
+        self.adapter = HTTPAdapter(pool_connections = pool_size,
+                                    pool_maxsize     = pool_size)
+        self.scheduler = schedule.Scheduler()
+        self.wake_event = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers = max_workers)
+
+        self.spiders:Dict[str,RUCSpider] = {}
+        self.futures:Dict[Tuple[str,str],Future] = {}
+        self.running:bool = False
+
+        os.makedirs(self.state_dir, exist_ok = True)
+
+    def __repr__(self) -> str:
+        return f'Orchestrator with {len(self.spiders)} account(s)'
+
+    def state_path(self, user_id:str) -> str:
+        return os.path.join(self.state_dir, f'{user_id}.pkl')
+
+    def add_account(self, user_id:str, passward:str, **watch) -> RUCSpider:
+        """
+        Load or create the spider of an account, and schedule its jobs.
+
+        Args:
+            user_id (str): The id of the account.
+            passward (str): The password of the account.
+            **watch: The parameters of RUCSpider.run, e.g. checking_interval_seconds and lecture_type.
+
+        Returns:
+            RUCSpider: The spider of the account.
+        """
+        if user_id in self.spiders:
+            self.remove_account(user_id)
+
+        spider = RUCSpider(load_path = self.state_path(user_id), base_url = self.base_url)
+        spider.set_user(user_id, passward)
+        spider.set_adapter(self.adapter)
+
+        for job in spider.schedule_jobs(self.scheduler, dispatch = self.dispatcher(user_id), **watch):
+            job.tag(user_id)
+
+        self.spiders[user_id] = spider
+        self.wake_event.set()
+
+        logger.info("Account {} added.".format(user_id))
+        return spider
+
+    def remove_account(self, user_id:str, save:bool = True):
+        """
+        Stop the jobs and the sniper of an account, then save and close its store.
+        The jobs not started yet are cancelled, the running ones are waited for, as they still write to the store.
+        """
+        spider = self.spiders.pop(user_id, None)
+        self.scheduler.clear(user_id)
+
+        futures = [self.futures.pop(key) for key in list(self.futures.keys()) if key[0] == user_id]
+        for future in futures:
+            future.cancel()
+        wait(futures)
+
+        if spider is not None:
+            if spider.sniper is not None:
+                spider.sniper.stop(wait = True)
+            if save:
+                spider.save()
+            spider.store.close()
+
+    def dispatcher(self, user_id:str) -> Callable:
+        """
+        Build the dispatch function of an account, which runs the jobs in the shared thread pool.
+        A job still running from the last time is not started again.
+        """
+        def dispatch(job:Callable, *args):
+            key = (user_id, job.__name__)
+
+            running = self.futures.get(key)
+            if running is not None and not running.done():
+                logger.warning("{} of {} is still running, skipping.".format(job.__name__, user_id))
+                return
+
+            self.futures[key] = self.executor.submit(job, *args)
+
+        return dispatch
+
+    def save(self, user_id:str = None):
+        """
+        Save the state of an account, or of all the accounts if user_id is None.
+        """
+        user_ids = list(self.spiders.keys()) if user_id is None else [user_id]
+
+        for user_id in user_ids:
+            self.spiders[user_id].save()
+
+    def run(self):
+        self.running = True
+
+        try:
+            serve_scheduler(self.scheduler, self.wake_event, lambda: self.running)
+        except KeyboardInterrupt:
+            logger.info("Encounter keyboard interrupt, exiting...")
+
+        # Let the polls on the way finish, so the saved state includes them.
+        wait(list(self.futures.values()))
+        self.save()
+
+    def stop(self):
+        self.running = False
+        self.wake_event.set()
@@ -0,0 +1,158 @@
+"""
+The order the new lectures of a poll are registered in.
+
+When several lectures open at once, the one about to close or fill should not wait behind the others.
+The registrations are queued by RULES, e.g. the earliest end of registration first, then the fewest seats left,
+and served by a few workers. A lecture found later in the poll is put in its place in the queue, ahead of the ones waiting.
+
+>>> spider.set_registration_rules('preference', 'seats', 'deadline')
+"""
+import heapq
+import itertools
+import threading
+import contextvars
+from typing import Dict, Any, List, Tuple, Callable, Iterable
+
+from loguru import logger
+
+from lecture import Lecture
+
+
+def score(applyscore:Any) -> float:
+    try:
+        return float(applyscore)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# Each rule maps a lecture, and the preference of the watch it was found by, to a key. The lower keys go first.
+RULES:Dict[str, Callable[[Lecture, float], float]] = {
+    # The registration closing first.
+    'deadline'  : lambda lecture, preference: lecture.regist_end.timestamp() if lecture.regist_end else float('inf'),
+    # The fewest seats left, the lectures not telling go last.
+    'seats'     : lambda lecture, preference: lecture.seats_left if lecture.seats_left is not None else float('inf'),
+    # The most credits.
+    'applyscore': lambda lecture, preference: -score(lecture.applyscore),
+    # The watch the user prefers, refer to Watch.preference.
+    'preference': lambda lecture, preference: -preference
+}
+
+DEFAULT_RULES = ('preference', 'deadline', 'seats', 'applyscore')
+
+
+def check_rules(rules:Iterable[str]) -> Tuple[str, ...]:
+    """
+    Raises:
+        ValueError: if a rule is not one of RULES.
+    """
+    rules = tuple(rules)
+    unknown = [rule for rule in rules if rule not in RULES]
+    if len(unknown) > 0:
+        raise ValueError(f"unknown rule(s) {unknown}, choose from {list(RULES)}")
+    return rules
+
+
+class RegistrationQueue(object):
+    '''
+    The registrations waiting for a worker, served by `rules`, then by arrival. Without rules, they are served by arrival only.
+
+    The lectures are pushed while the poll is still searching, and `concurrency` workers pop them
+    as they become free, so a lecture pushed later still goes before the ones ranked behind it.
+    '''
+
+    def __init__(self, rules:Iterable[str] = DEFAULT_RULES):
+        """
+        Args:
+            rules (Iterable[str], optional): The names of RULES, the first one decides first. Defaults to DEFAULT_RULES.
+        """
+        self.rules = check_rules(rules)
+        self.heap:List[Tuple[Tuple[float, ...], int, Lecture]] = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def __repr__(self) -> str:
+        return f'RegistrationQueue of {len(self)} lecture(s) by {", ".join(self.rules)}'
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def key(self, lecture:Lecture, preference:float = 0.0) -> Tuple[float, ...]:
+        return tuple(RULES[rule](lecture, preference) for rule in self.rules)
+
+    def push(self, lecture:Lecture, preference:float = 0.0):
+        with self.condition:
+            heapq.heappush(self.heap, (self.key(lecture, preference), next(self.counter), lecture))
+            self.condition.notify()
+
+    def pop(self) -> Lecture:
+        """
+        Wait for the first lecture of the queue.
+
+        Returns:
+            Lecture: None once the queue is closed and empty.
+        """
+        with self.condition:
+            while len(self.heap) == 0 and not self.closed:
+                self.condition.wait()
+
+            if len(self.heap) == 0:
+                return None
+            return heapq.heappop(self.heap)[2]
+
+    def close(self):
+        """
+        No more lectures are coming, the workers stop once the queue is empty.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def dispatch(self,
+                entries    : Iterable[Tuple[Lecture, float]],
+                regist     : Callable[[str], Any],
+                concurrency: int = 1) -> Dict[str, Any]:
+        """
+        Queue the lectures as they come from `entries`, and register them in order with `concurrency` workers.
+
+        Args:
+            entries (Iterable[Tuple[Lecture, float]]): The lectures and the preference of their watch, may be a stream.
+            regist (Callable[[str], Any]): Register a lecture by its aid, e.g. RUCSpider.regist.
+            concurrency (int, optional): The max number of registrations on the fly. Defaults to 1.
+
+        Returns:
+            Dict[str, Any]: The result of `regist` of each aid.
+        """
+        results:Dict[str, Any] = {}
+        errors:List[BaseException] = []
+
+        def work():
+            while True:
+                lecture = self.pop()
+                if lecture is None:
+                    return
+
+                try:
+                    results[lecture.aid] = regist(lecture.aid)
+                except Exception as e:
+                    logger.error("Fail to register {}: {}".format(lecture.aid, e))
+                    errors.append(e)
+
+        # A copy of the context each, so the registrations are traced within the poll.
+        workers = [threading.Thread(target = contextvars.copy_context().run, args = (work,), daemon = True)
+                    for _ in range(max(concurrency, 1))]
+        for worker in workers:
+            worker.start()
+
+        try:
+            for lecture, preference in entries:
+                self.push(lecture, preference)
+        finally:
+            self.close()
+            for worker in workers:
+                worker.join()
+
+        if len(errors) > 0:
+            raise errors[0]
+
+        return results
@@ -0,0 +1,136 @@
+"""
+A token bucket shared by every spider of the process, so running more spiders or polling faster never floods the server.
+
+The requests are served by priority: registrations first, then logins, then the search polls.
+The polls also leave a few tokens in the bucket, so a registration arriving right after a burst of polls does not wait.
+"""
+import time
+import heapq
+import itertools
+import threading
+from urllib.parse import urlparse
+from typing import Dict, List, Tuple
+
+from metrics import METRICS
+
+REGISTRATION, LOGIN, POLL = 'registration', 'login', 'poll'
+PRIORITIES:Dict[str, int] = {REGISTRATION: 0, LOGIN: 1, POLL: 2}
+
+# The endpoints not listed are polls.
+ENDPOINT_PRIORITIES:Dict[str, str] = {
+    '/campus/Regist/regist': REGISTRATION,
+    '/auth/login'          : LOGIN,
+    '/auth/captcha'        : LOGIN
+}
+
+RATE = 10.0
+BURST = 10
+RESERVE = 2
+
+
+def priority_for(url:str) -> str:
+    return ENDPOINT_PRIORITIES.get(urlparse(url).path, POLL)
+
+
+class RateLimiter(object):
+    '''
+    A token bucket refilled at `rate` tokens a second, holding at most `burst`. Each request takes a token.
+
+    The requests waiting are queued by priority, then by arrival, and only the first one in the queue takes a token.
+    A poll only takes a token if `reserve` more are left for the higher priorities.
+    '''
+
+    def __init__(self,
+                rate   : float = RATE,
+                burst  : int   = BURST,
+                reserve: int   = RESERVE):
+        """
+        Args:
+            rate (float, optional): The tokens added per second, None to disable the limiter. Defaults to RATE.
+            burst (int, optional): The max number of tokens, i.e. the requests sent at once after a quiet time. Defaults to BURST.
+            reserve (int, optional): The tokens a poll leaves to registrations and logins. Defaults to RESERVE.
+        """
+        self.condition = threading.Condition()
+        self.waiting:List[Tuple[int, int]] = []
+        self.counter = itertools.count()
+
+        self.configure(rate, burst, reserve)
+
+    def __repr__(self) -> str:
+        if self.rate is None:
+            return 'RateLimiter (off)'
+        return f'RateLimiter of {self.rate}/s, burst {self.burst}, reserve {self.reserve}'
+
+    def configure(self,
+                rate   : float = RATE,
+                burst  : int   = BURST,
+                reserve: int   = RESERVE):
+        assert rate is None or rate > 0, "rate should be positive, or None to disable the limiter"
+        assert 0 <= reserve < burst, "reserve should be less than burst"
+
+        with self.condition:
+            self.rate = rate
+            self.burst = burst
+            self.reserve = reserve
+            self.tokens:float = burst
+            self.updated = time.monotonic()
+            self.condition.notify_all()
+
+    def refill(self, now:float):
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.burst)
+        self.updated = now
+
+    def acquire(self, priority:str = POLL, timeout:float = None) -> bool:
+        """
+        Wait for a token.
+
+        Args:
+            priority (str, optional): REGISTRATION, LOGIN or POLL. Defaults to POLL.
+            timeout (float, optional): The max seconds to wait. Defaults to None, which waits as long as needed.
+
+        Returns:
+            bool: False if no token is got within the timeout.
+        """
+        if self.rate is None:
+            return True
+
+        begin = time.monotonic()
+        deadline = None if timeout is None else begin + timeout
+        needed = 1 if priority != POLL else 1 + self.reserve
+
+        with self.condition:
+            ticket = (PRIORITIES[priority], next(self.counter))
+            heapq.heappush(self.waiting, ticket)
+
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self.rate is None:
+                        return True
+                    self.refill(now)
+
+                    if self.waiting[0] == ticket and self.tokens >= needed:
+                        self.tokens -= 1
+                        break
+
+                    if deadline is not None and now >= deadline:
+                        return False
+
+                    # Sleep until the missing tokens are refilled, or a request ahead is served.
+                    wait = max(needed - self.tokens, 0) / self.rate or 1 / self.rate
+                    if deadline is not None:
+                        wait = min(wait, deadline - now)
+                    self.condition.wait(wait)
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.condition.notify_all()
+
+        waited = time.monotonic() - begin
+        if waited > 0.001:
+            METRICS.increment(f'throttled_seconds_{priority}', waited)
+
+        return True
+
+
+LIMITER = RateLimiter()
@@ -0,0 +1,243 @@
+"""
+How query_html copes with a failing server: a retry policy per endpoint, a retry budget shared by the process,
+and a circuit breaker which stops the polls while the server is down, but still lets registrations and logins through.
+"""
+import time
+import random
+import threading
+from collections import deque
+from urllib.parse import urlparse
+from typing import Dict
+
+from loguru import logger
+
+from metrics import METRICS
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+BUDGET_RATIO = 0.2
+BUDGET_MIN_RETRIES = 3
+BUDGET_WINDOW = 10
+
+BREAKER_THRESHOLD = 5
+BREAKER_RESET = 15
+BREAKER_MAX_RESET = 300
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+BREAKER_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class RetryPolicy(object):
+    '''
+    How the requests to an endpoint are retried.
+
+    The waits grow exponentially from `base` up to `cap`, and each is drawn at random below that ("full jitter"),
+    so the spiders hit by the same outage do not come back all at once.
+    '''
+
+    def __init__(self,
+                attempts: int   = 3,
+                base    : float = 0.5,
+                cap     : float = 8.0,
+                critical: bool  = False):
+        """
+        Args:
+            attempts (int, optional): The max number of tries, the first one included. Defaults to 3.
+            base (float, optional): The seconds of the first wait before jitter. Defaults to 0.5.
+            cap (float, optional): The max seconds of a wait. Defaults to 8.0.
+            critical (bool, optional): Whether the requests are sent even if the circuit breaker is open. Defaults to False.
+        """
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.critical = critical
+
+    def __repr__(self) -> str:
+        return f'RetryPolicy of {self.attempts} attempt(s) from {self.base}s to {self.cap}s' + (', critical' if self.critical else '')
+
+    def wait(self, attempt:int) -> float:
+        """
+        The seconds to wait after the `attempt`-th failed try.
+        """
+        return random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+
+
+# The polls run again soon anyway, registrations are worth a few quick tries, a login is needed to register.
+# The captchas are mostly prefetched in the background, so they back off with the polls.
+RETRY_POLICIES:Dict[str, RetryPolicy] = {
+    '/campus/v2/search'    : RetryPolicy(attempts = 2, base = 1.0, cap = 10.0),
+    '/campus/Regist/regist': RetryPolicy(attempts = 4, base = 0.1, cap = 1.0, critical = True),
+    '/auth/login'          : RetryPolicy(attempts = 3, base = 0.5, cap = 4.0, critical = True),
+    '/auth/captcha'        : RetryPolicy(attempts = 3, base = 0.5, cap = 4.0)
+}
+
+DEFAULT_POLICY = RetryPolicy()
+
+
+def policy_for(url:str) -> RetryPolicy:
+    return RETRY_POLICIES.get(urlparse(url).path, DEFAULT_POLICY)
+
+
+class RetryBudget(object):
+    '''
+    The retries allowed to the whole process: at most `ratio` of the requests of the last `window` seconds,
+    plus `min_retries` so a quiet spider can still retry.
+
+    When the server is failing, most requests fail, and unbounded retries would multiply the load on it.
+    '''
+
+    def __init__(self,
+                ratio      : float = BUDGET_RATIO,
+                min_retries: int   = BUDGET_MIN_RETRIES,
+                window     : float = BUDGET_WINDOW):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+
+        self.requests:deque = deque()
+        self.retries:deque = deque()
+        self.lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f'RetryBudget of {self.ratio:.0%} + {self.min_retries} per {self.window}s'
+
+    def forget(self, now:float):
+        for times in (self.requests, self.retries):
+            while len(times) > 0 and times[0] <= now - self.window:
+                times.popleft()
+
+    def record_request(self):
+        with self.lock:
+            self.requests.append(time.monotonic())
+
+    def try_retry(self) -> bool:
+        """
+        Take a retry from the budget.
+
+        Returns:
+            bool: False if the budget is spent, and the request should fail instead.
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            self.forget(now)
+
+            if len(self.retries) >= self.min_retries + self.ratio * len(self.requests):
+                return False
+
+            self.retries.append(now)
+            return True
+
+
+class CircuitBreaker(object):
+    '''
+    Stop sending the non-critical requests while the server keeps failing.
+
+    After `threshold` failures in a row, the breaker opens for `reset_timeout` seconds.
+    Then a single request is let through to probe the server: its success closes the breaker,
+    its failure opens it again for twice as long, up to `max_reset_timeout`.
+    '''
+
+    def __init__(self,
+                threshold        : int   = BREAKER_THRESHOLD,
+                reset_timeout    : float = BREAKER_RESET,
+                max_reset_timeout: float = BREAKER_MAX_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+
+        self.state:str = CLOSED
+        self.failures:int = 0
+        self.timeout:float = reset_timeout
+        self.opened_at:float = 0.0
+        self.probing:bool = False
+        self.lock = threading.Lock()
+
+        METRICS.set_gauge('breaker_state', BREAKER_STATES[CLOSED])
+
+    def __repr__(self) -> str:
+        return f'CircuitBreaker {self.state}'
+
+    def set_state(self, state:str):
+        if state == self.state:
+            return
+
+        self.state = state
+        METRICS.set_gauge('breaker_state', BREAKER_STATES[state])
+
+        if state == OPEN:
+            METRICS.increment('breaker_opened')
+            logger.warning("The server keeps failing, pausing the polls for {:.0f} seconds.".format(self.timeout))
+        elif state == HALF_OPEN:
+            logger.info("Probing the server...")
+        else:
+            logger.success("The server is back, resuming the polls.")
+
+    def remaining_seconds(self) -> float:
+        """
+        The seconds until the breaker lets a probe through, 0 if it is not open.
+        """
+        if self.state != OPEN:
+            return 0.0
+        return max(self.opened_at + self.timeout - time.monotonic(), 0.0)
+
+    def is_open(self) -> bool:
+        return self.state == OPEN and self.remaining_seconds() > 0
+
+    def allow(self, critical:bool = False) -> bool:
+        """
+        Whether a request may be sent now. A critical request always is.
+        """
+        if critical:
+            return True
+
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+
+            if self.state == OPEN and self.remaining_seconds() > 0:
+                return False
+
+            # The timeout is over, only one request probes the server.
+            if self.probing:
+                return False
+
+            self.set_state(HALF_OPEN)
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.probing = False
+            self.timeout = self.reset_timeout
+            self.set_state(CLOSED)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+
+            if self.state == HALF_OPEN:
+                self.probing = False
+                self.timeout = min(self.timeout * 2, self.max_reset_timeout)
+            elif self.state == OPEN or self.failures < self.threshold:
+                return
+
+            self.opened_at = time.monotonic()
+            self.set_state(OPEN)
+
+
+RETRY_BUDGET = RetryBudget()
+BREAKER = CircuitBreaker()
+
+
+def budget_spent(retry_state) -> bool:
+    """
+    A stop condition of tenacity, true once RETRY_BUDGET denies the retry.
+    """
+    if RETRY_BUDGET.try_retry():
+        return False
+
+    METRICS.increment('retries_denied')
+    logger.warning("Retry budget spent, giving up the request.")
+    return True
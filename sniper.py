@@ -0,0 +1,216 @@
+import time
+import heapq
+import itertools
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Callable, Union
+
+from loguru import logger
+
+from metrics import METRICS
+from lecture import Lecture
+
+SNIPE_BURST = 5
+SNIPE_SPACING = 0.05
+SNIPE_LEAD = 0.02
+SNIPE_WARMUP = 30
+SPIN_SECONDS = 0.02
+SNIPE_WORKERS = 4
+
+# The answers worth another attempt of the burst: the registration has not opened yet on the server's clock.
+# Any other answer is final, e.g. registered, full or registered before.
+NOT_OPEN_MESSAGES = ('报名未开始',)
+
+
+def is_not_open(lecture:Lecture) -> bool:
+    """
+    Whether the registration of the lecture opens in the future.
+    """
+    return lecture.regist_begin is not None and lecture.regist_begin > datetime.now()
+
+
+def is_final(result:Union[str, None]) -> bool:
+    """
+    Whether the answer of a registration settles it. No answer at all (None) does not.
+    """
+    return result is not None and result not in NOT_OPEN_MESSAGES
+
+
+class Sniper(object):
+    '''
+    Register lectures right at the moment their registration opens.
+
+    A single timer thread keeps the openings in a heap. Shortly before each one, it warms the cookie and the connection,
+    waits the last moment on a high-resolution clock, and fires a short burst of registrations around the opening,
+    each sent by a worker so the lectures opening together do not wait for each other.
+    The burst stops at the first final answer of the server, see is_final.
+    How far after the opening each attempt was sent is kept in reports.
+    '''
+
+    def __init__(self,
+                spider,
+                burst  : int   = SNIPE_BURST,
+                spacing: float = SNIPE_SPACING,
+                lead   : float = SNIPE_LEAD,
+                warmup : float = SNIPE_WARMUP,
+                workers: int   = SNIPE_WORKERS):
+        """
+        Args:
+            spider (RUCSpider): The spider to register with.
+            burst (int, optional): The max number of attempts per lecture. Defaults to SNIPE_BURST.
+            spacing (float, optional): The seconds between two attempts. Defaults to SNIPE_SPACING.
+            lead (float, optional): The seconds the first attempt is sent ahead of the opening,
+                to make up for the way to the server. Defaults to SNIPE_LEAD.
+            warmup (float, optional): The seconds ahead of the opening to refresh the cookie and connection. Defaults to SNIPE_WARMUP.
+            workers (int, optional): The max number of attempts on the fly. Defaults to SNIPE_WORKERS.
+        """
+        self.spider = spider
+        self.burst = burst
+        self.spacing = spacing
+        self.lead = lead
+        self.warmup = warmup
+
+        self.pending:Dict[str,datetime] = {}
+        self.reports:List[Dict] = []
+        self.timers:List[Tuple[float, int, Callable, tuple]] = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers = workers)
+        self.thread:threading.Thread = None
+
+    def __repr__(self) -> str:
+        return f'Sniper with {len(self.pending)} lecture(s) pending'
+
+    def schedule(self, lecture:Lecture) -> bool:
+        """
+        Plan the registration of a lecture at its opening. A lecture already planned is ignored.
+
+        Returns:
+            bool: whether a new snipe is planned.
+        """
+        aid = lecture.aid
+        opening = lecture.regist_begin
+
+        if opening is None:
+            return False
+
+        # Convert the wall clock opening to the monotonic high-resolution clock once.
+        opening_perf = time.perf_counter() + (opening.timestamp() - time.time())
+
+        with self.condition:
+            if aid in self.pending:
+                return False
+            self.pending[aid] = opening
+
+            if self.thread is None:
+                self.thread = threading.Thread(target = self.run, daemon = True)
+                self.thread.start()
+
+        logger.info("Lecture {} opens at {}, sniping then.".format(aid, opening))
+        self.at(opening_perf - self.warmup, self.warm, lecture, opening_perf)
+        return True
+
+    def at(self, deadline:float, action:Callable, *args):
+        """
+        Run `action(*args)` in a worker at `deadline` on the perf_counter clock.
+        """
+        with self.condition:
+            heapq.heappush(self.timers, (deadline, next(self.counter), action, args))
+            self.condition.notify()
+
+    def run(self):
+        """
+        The timer thread: sleep until the first deadline, or until an earlier one is added, spinning over the last SPIN_SECONDS.
+        """
+        while not self.stop_event.is_set():
+            with self.condition:
+                if len(self.timers) == 0:
+                    self.condition.wait()
+                    continue
+
+                remaining = self.timers[0][0] - time.perf_counter()
+                if remaining > SPIN_SECONDS:
+                    self.condition.wait(remaining - SPIN_SECONDS)
+                    continue
+
+                deadline, _, action, args = heapq.heappop(self.timers)
+
+            while time.perf_counter() < deadline:
+                pass
+
+            if self.stop_event.is_set():
+                return
+            try:
+                self.executor.submit(action, *args)
+            except RuntimeError:
+                # Shut down by stop meanwhile.
+                return
+
+    def warm(self, lecture:Lecture, opening_perf:float):
+        """
+        Make sure the cookie will not expire during the burst, and the connection is open, then plan the first attempt.
+        """
+        try:
+            self.spider.keep_session()
+            self.spider.export_cookie()
+            self.spider.ping()
+        except Exception as e:
+            logger.warning("Fail to warm up for {}: {}".format(lecture.aid, e))
+
+        # From now on the polls leave the lecture to the sniper.
+        self.spider.mark_checked(lecture)
+        self.at(opening_perf - self.lead, self.attempt, lecture, opening_perf, 0)
+
+    def attempt(self, lecture:Lecture, opening_perf:float, attempt:int):
+        aid = lecture.aid
+        sent = time.perf_counter()
+
+        try:
+            result = self.spider.regist(aid)
+        except Exception as e:
+            logger.warning("Snipe {} #{} failed: {}".format(aid, attempt + 1, e))
+            result = None
+
+        report = {'aid'        : aid,
+                'attempt'    : attempt + 1,
+                'offset_ms'  : (sent - opening_perf) * 1000,
+                'response_ms': (time.perf_counter() - sent) * 1000,
+                'result'     : result}
+        self.reports.append(report)
+
+        logger.info("Snipe {aid} #{attempt}: sent {offset_ms:+.1f} ms after opening, {result}".format(**report))
+
+        if result == "注册成功":
+            with METRICS.measure('notification'):
+                self.spider.notice([lecture])
+
+        if is_final(result):
+            self.finish(aid)
+        elif attempt + 1 < self.burst:
+            self.at(opening_perf - self.lead + (attempt + 1) * self.spacing, self.attempt, lecture, opening_perf, attempt + 1)
+        else:
+            # No final answer, leave the lecture to the next polls.
+            logger.warning("Snipe {} got no final answer, back to the polls.".format(aid))
+            self.spider.unmark_checked([lecture])
+            self.finish(aid)
+
+    def finish(self, aid:str):
+        with self.condition:
+            self.pending.pop(aid, None)
+
+    def stop(self, wait:bool = False):
+        """
+        Drop the snipes planned.
+
+        Args:
+            wait (bool, optional): wait for the attempts on the way, e.g. before closing the store. Defaults to False.
+        """
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify_all()
+        self.executor.shutdown(wait = wait)
+
+        if wait and self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,137 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Tuple, Union, Iterable
+
+STORE_SUFFIX = '.db'
+MEMORY = ':memory:'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS profile (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lectures (
+    aid         TEXT PRIMARY KEY,
+    expire_time REAL NOT NULL,
+    registered  INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS lectures_expire_time ON lectures (expire_time);
+'''
+
+
+def store_path(load_path:Union[str, None]) -> str:
+    """
+    The database next to the pickle of the previous versions, e.g. spider.pkl -> spider.db.
+    """
+    if load_path is None:
+        return MEMORY
+    return os.path.splitext(load_path)[0] + STORE_SUFFIX
+
+
+class StateStore(object):
+    '''
+    The state of a spider in a SQLite database, written as it changes instead of all at once on exit.
+
+    The profile holds the small values (the account, the cookie, the publication histogram) as json.
+    The lectures checked are one row each, so marking a lecture writes one row,
+    and the startup reads only the lectures whose registration has not ended.
+    Every write is a transaction of its own, so a crash loses at most the write on the way.
+    '''
+
+    def __init__(self, path:str = MEMORY):
+        """
+        Args:
+            path (str, optional): The database file. Defaults to MEMORY, which keeps nothing on disk.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, check_same_thread = False)
+
+        with self.lock, self.connection:
+            # WAL keeps the writes cheap and the database readable after a crash in the middle of one.
+            self.connection.execute('PRAGMA journal_mode = WAL')
+            self.connection.execute('PRAGMA synchronous = NORMAL')
+            self.connection.executescript(SCHEMA)
+
+    def __repr__(self) -> str:
+        return f'StateStore at {self.path}'
+
+    def save_profile(self, **values:Any):
+        """
+        Write the values given, in one transaction. A value of None removes the key.
+        """
+        with self.lock, self.connection:
+            for key, value in values.items():
+                if value is None:
+                    self.connection.execute('DELETE FROM profile WHERE key = ?', (key,))
+                else:
+                    self.connection.execute('INSERT OR REPLACE INTO profile (key, value) VALUES (?, ?)',
+                                            (key, json.dumps(value, ensure_ascii = False)))
+
+    def load_profile(self) -> Dict[str, Any]:
+        with self.lock:
+            rows = self.connection.execute('SELECT key, value FROM profile').fetchall()
+
+        return {key: json.loads(value) for key, value in rows}
+
+    def add_lecture(self, aid:str, expire_time:datetime, registered:bool = False):
+        """
+        Record a lecture checked. A lecture already registered stays registered.
+        """
+        with self.lock, self.connection:
+            self.connection.execute('''INSERT INTO lectures (aid, expire_time, registered) VALUES (?, ?, ?)
+                                        ON CONFLICT (aid) DO UPDATE SET
+                                            expire_time = excluded.expire_time,
+                                            registered  = MAX(registered, excluded.registered)''',
+                                    (aid, expire_time.timestamp(), int(registered)))
+
+    def add_lectures(self, lectures:Iterable[Tuple[str, datetime]]):
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO lectures (aid, expire_time) VALUES (?, ?)',
+                                        [(aid, expire_time.timestamp()) for aid, expire_time in lectures])
+
+    def mark_registered(self, aid:str):
+        with self.lock, self.connection:
+            self.connection.execute('UPDATE lectures SET registered = 1 WHERE aid = ?', (aid,))
+
+    def load_lectures(self, now:datetime = None) -> List[Tuple[str, datetime]]:
+        """
+        The lectures whose registration has not ended at `now`.
+        """
+        if now is None:
+            now = datetime.now()
+
+        with self.lock:
+            rows = self.connection.execute('SELECT aid, expire_time FROM lectures WHERE expire_time > ?',
+                                            (now.timestamp(),)).fetchall()
+
+        return [(aid, datetime.fromtimestamp(expire_time)) for aid, expire_time in rows]
+
+    def remove_lectures(self, aids:Iterable[str]):
+        with self.lock, self.connection:
+            self.connection.executemany('DELETE FROM lectures WHERE aid = ?', [(aid,) for aid in aids])
+
+    def compact(self, now:datetime = None) -> int:
+        """
+        Drop the lectures whose registration has ended, and fold the WAL back into the database.
+
+        Returns:
+            int: The number of lectures dropped.
+        """
+        if now is None:
+            now = datetime.now()
+
+        with self.lock:
+            with self.connection:
+                removed = self.connection.execute('DELETE FROM lectures WHERE expire_time <= ?', (now.timestamp(),)).rowcount
+            self.connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+        return removed
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,34 @@
+"""
+An account removed from the orchestrator stops for good, its sniper included: run with `python -m pytest`.
+"""
+import time
+import threading
+
+from orchestrator import Orchestrator
+
+
+def test_removed_account_stops_sniping(campus, tmp_path):
+    lecture = campus.make_lecture(opens_in = 3.0)
+    campus.publish(0.0, lecture)
+
+    orchestrator = Orchestrator(state_dir = str(tmp_path / 'spiders'), base_url = campus.base_url)
+    spider = orchestrator.add_account('mock', 'mock', checking_interval_seconds = 1, snipe = True)
+    spider.set_captcha('mock', 'mock')
+
+    runner = threading.Thread(target = orchestrator.run, daemon = True)
+    runner.start()
+
+    deadline = time.perf_counter() + 5
+    while len(spider.sniper.pending) == 0 and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    assert str(lecture['aid']) in spider.sniper.pending
+
+    orchestrator.remove_account('mock')
+    assert not spider.sniper.thread.is_alive()
+
+    # Past the opening, nothing of the account reaches the server any more.
+    time.sleep(3.5)
+    orchestrator.stop()
+    runner.join()
+
+    assert campus.registrations == {}
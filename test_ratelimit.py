@@ -0,0 +1,81 @@
+"""
+The shared rate limiter holds the spiders to the limit, and lets registrations through first: run with `python -m pytest`.
+"""
+import time
+import threading
+
+import pytest
+
+from components import RUCSpider
+from mock_server import make_spider
+from ratelimit import LIMITER, RATE, BURST, RESERVE, RateLimiter, REGISTRATION, POLL
+
+# The scheduling of the threads lets the rate seen overshoot a little.
+TOLERANCE = 0.1
+
+
+@pytest.fixture
+def limiter():
+    yield LIMITER
+    LIMITER.configure(RATE, BURST, RESERVE)
+
+
+def test_server_sees_at_most_the_limit(campus, limiter):
+    rate, burst, duration = 20.0, 5, 3.0
+    campus.latency = 0.01
+
+    campus.publish_every(duration / 6, count = 6, first = 0.2)
+    spiders = [make_spider(campus.base_url) for _ in range(4)]
+
+    limiter.configure(rate, burst, reserve = 1)
+    campus.requests.clear()
+    end = time.perf_counter() + duration
+
+    def poll(spider:RUCSpider):
+        while time.perf_counter() < end:
+            spider.check_lecture(max_lecture_num = 10, incremental = False)
+
+    threads = [threading.Thread(target = poll, args = (spider,)) for spider in spiders]
+    begin = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - begin
+
+    requests = sum(campus.requests.values())
+
+    # The bucket starts full, so a burst comes on top of the rate.
+    assert requests <= burst + rate * elapsed * (1 + TOLERANCE)
+    # The spiders did saturate the limiter, or the check above says nothing.
+    assert requests >= rate * elapsed * (1 - 2 * TOLERANCE)
+    assert len(campus.registrations) > 0
+
+
+def test_registrations_never_wait_behind_polls():
+    rate = 20.0
+    limiter = RateLimiter(rate = rate, burst = 5, reserve = 1)
+    end = time.perf_counter() + 2.0
+
+    def flood():
+        while time.perf_counter() < end:
+            limiter.acquire(POLL)
+
+    threads = [threading.Thread(target = flood) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+
+    waits = []
+    time.sleep(0.3)
+    while time.perf_counter() < end - 0.2:
+        begin = time.perf_counter()
+        limiter.acquire(REGISTRATION)
+        waits.append(time.perf_counter() - begin)
+        time.sleep(0.1)
+
+    for thread in threads:
+        thread.join()
+
+    # At worst a registration waits for the next token, never for the polls queued before it.
+    assert len(waits) > 5
+    assert max(waits) <= 1 / rate + 0.03
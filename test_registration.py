@@ -0,0 +1,210 @@
+"""
+No lecture is registered twice: run with `python -m pytest`.
+
+The spider polls mock_server.MockCampus, which records every registration it receives.
+"""
+from datetime import datetime, timedelta
+
+import time
+import threading
+
+import pytest
+
+from components import RUCSpider, LecturePool
+from components import COOKIE_VALID_TIME, COOKIE_REFRESH_AHEAD, SESSION_CHECK_INTERVAL
+from mock_server import make_spider
+
+
+def poll(spider:RUCSpider, times:int, perpage:int = 3):
+    for _ in range(times):
+        spider.check_lecture(max_lecture_num = perpage, max_pages = 10)
+
+
+def test_each_lecture_registered_once(campus):
+    lectures = [campus.publish(0.0) for _ in range(7)]
+    spider = make_spider(campus.base_url)
+
+    poll(spider, 3)
+
+    assert sorted(campus.registrations) == sorted(str(lecture['aid']) for lecture in lectures)
+    assert all(len(times) == 1 for times in campus.registrations.values())
+
+
+def test_str_and_int_aids_are_the_same_lecture(campus):
+    lecture = campus.make_lecture()
+    campus.publish(0.0, lecture)
+    spider = make_spider(campus.base_url)
+
+    poll(spider, 1)
+
+    # The server now sends the same lecture with its aid as a str.
+    campus.publish(0.0, dict(lecture, aid = str(lecture['aid'])))
+    poll(spider, 2)
+
+    assert campus.registrations.keys() == {str(lecture['aid'])}
+    assert len(campus.registrations[str(lecture['aid'])]) == 1
+
+
+def test_lecture_repeated_across_pages(campus):
+    repeated = campus.make_lecture()
+    campus.publish(0.0, repeated)
+    for _ in range(4):
+        campus.publish(0.0)
+    # Newest first, so the second copy lands on the second page of 3.
+    campus.publish(0.0, dict(repeated))
+
+    spider = make_spider(campus.base_url)
+    poll(spider, 2)
+
+    assert len(campus.registrations) == 5
+    assert len(campus.registrations[str(repeated['aid'])]) == 1
+
+
+def test_new_lectures_between_polls(campus):
+    spider = make_spider(campus.base_url)
+
+    for _ in range(3):
+        campus.publish(0.0)
+        poll(spider, 1)
+
+    assert len(campus.registrations) == 3
+    assert all(len(times) == 1 for times in campus.registrations.values())
+
+
+def test_unanswered_lecture_on_a_later_page_is_retried(campus):
+    lectures = [campus.publish(0.0) for _ in range(5)]
+    spider = make_spider(campus.base_url)
+
+    # Newest first, the oldest lecture is on the second page of 3, which the next polls stop before.
+    oldest = str(lectures[0]['aid'])
+    regist = spider.regist
+    unanswered = []
+
+    def regist_once_unanswered(aid:str):
+        if aid == oldest and len(unanswered) == 0:
+            unanswered.append(aid)
+            return None
+        return regist(aid)
+
+    spider.regist = regist_once_unanswered
+    poll(spider, 4)
+
+    assert unanswered == [oldest]
+    assert len(campus.registrations) == 5
+    assert all(len(times) == 1 for times in campus.registrations.values())
+
+
+def test_custom_filter_sees_changed_fields(campus):
+    lecture = campus.make_lecture()
+    lecture['location'] = '明德楼'
+    campus.publish(0.0, lecture)
+    spider = make_spider(campus.base_url)
+
+    def in_library(lecture) -> bool:
+        return lecture['location'] == '图书馆'
+
+    spider.check_lecture(max_lecture_num = 3, filter_function = in_library)
+    assert len(campus.registrations) == 0
+
+    # Only a field the spider does not parse changes, the incremental poll still hands it to the filter.
+    lecture['location'] = '图书馆'
+    spider.check_lecture(max_lecture_num = 3, filter_function = in_library)
+
+    assert campus.registrations.keys() == {str(lecture['aid'])}
+
+
+def test_clear_expired_only_pops_ended_lectures():
+    now = datetime(2024, 5, 1, 12, 0, 0)
+    pool = LecturePool()
+
+    pool.add(1, now - timedelta(minutes = 5))
+    pool.add('2', now + timedelta(minutes = 5))
+    pool.add('3', now - timedelta(seconds = 1))
+    # Added again with a later end, its outdated entry must not remove it.
+    pool.add(3, now + timedelta(hours = 1))
+
+    assert pool.clear_expired(now) == ['1']
+    assert '1' not in pool
+    assert 2 in pool and '3' in pool
+
+    assert sorted(pool.clear_expired(now + timedelta(hours = 2))) == ['2', '3']
+    assert len(pool) == 0
+
+
+@pytest.mark.parametrize('auth_error_json, content_length', [(False, True), (True, True), (True, False)])
+def test_dropped_session_is_renewed(campus, auth_error_json, content_length):
+    campus.auth_error_json = auth_error_json
+    campus.content_length = content_length
+    spider = make_spider(campus.base_url)
+
+    # The server drops the session early, and says so by a redirect or by an auth error json, of a known length or not.
+    campus.expire_sessions()
+    lecture = campus.publish(0.0)
+    spider.set_captcha('test', 'test')
+    poll(spider, 1)
+
+    assert campus.registrations.keys() == {str(lecture['aid'])}
+    assert len(campus.registrations[str(lecture['aid'])]) == 1
+
+
+def test_error_reply_fails_only_the_poll(campus):
+    campus.content_length = False
+    campus.search_reply = {'code': 500, 'msg': '系统繁忙'}
+    lecture = campus.publish(0.0)
+    spider = make_spider(campus.base_url)
+
+    assert spider.check_lecture(max_lecture_num = 3) == (0, 0)
+
+    campus.search_reply = None
+    poll(spider, 1)
+
+    assert campus.registrations.keys() == {str(lecture['aid'])}
+
+
+def test_login_from_the_window_is_shared_with_the_polls(campus):
+    spider = make_spider(campus.base_url)
+    spider.cookie_maintainer.invalidate()
+    spider.set_captcha('test', 'test')
+    campus.latency = 0.2
+    campus.requests.clear()
+
+    # The user logs in from the window, the polls need the cookie meanwhile.
+    login = threading.Thread(target = spider.login)
+    login.start()
+    time.sleep(0.05)
+
+    cookies = []
+    polls = [threading.Thread(target = lambda: cookies.append(spider.export_cookie())) for _ in range(3)]
+    for thread in polls:
+        thread.start()
+    for thread in [login, *polls]:
+        thread.join()
+
+    assert campus.requests['POST /auth/login'] == 1
+    assert len(cookies) == 3 and all(cookie is not None for cookie in cookies)
+
+
+def test_captchas_prefetched_only_before_a_login(campus):
+    spider = make_spider(campus.base_url)
+    campus.requests.clear()
+
+    def expire_in(seconds:float):
+        spider.cookie_maintainer.birth_time = datetime.now() - timedelta(seconds = COOKIE_VALID_TIME - seconds)
+
+    # Hours of a valid cookie fetch no captcha.
+    for remaining in (COOKIE_VALID_TIME, 3600, COOKIE_REFRESH_AHEAD + SESSION_CHECK_INTERVAL + 1):
+        expire_in(remaining)
+        spider.keep_session()
+
+    time.sleep(0.2)
+    assert campus.requests['GET /auth/captcha'] == 0
+
+    # The check before the refresh fills the pool for it.
+    expire_in(COOKIE_REFRESH_AHEAD + SESSION_CHECK_INTERVAL / 2)
+    spider.keep_session()
+
+    deadline = time.perf_counter() + 5
+    while len(spider.captcha_pool) < spider.captcha_pool.size and time.perf_counter() < deadline:
+        time.sleep(0.05)
+
+    assert campus.requests['GET /auth/captcha'] == spider.captcha_pool.size
@@ -0,0 +1,55 @@
+"""
+The sniper registers a lecture at its opening, and stops at the first final answer: run with `python -m pytest`.
+"""
+import time
+
+from lecture import Lecture
+from mock_server import MockCampus, make_spider
+from sniper import Sniper
+
+
+def make_sniper(campus:MockCampus) -> Sniper:
+    return Sniper(make_spider(campus.base_url), burst = 4, spacing = 0.05, lead = 0.0, warmup = 0.3)
+
+
+def publish(campus:MockCampus, opens_in:float) -> Lecture:
+    lecture = campus.make_lecture(opens_in = opens_in)
+    campus.publish(0.0, lecture)
+    return Lecture.from_dict(lecture)
+
+
+def wait_done(sniper:Sniper, timeout:float = 10.0):
+    deadline = time.perf_counter() + timeout
+    while len(sniper.pending) > 0 and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    assert len(sniper.pending) == 0
+
+
+def test_lectures_share_one_timer_thread(campus):
+    sniper = make_sniper(campus)
+    lectures = [publish(campus, 1.5 + i) for i in range(3)]
+
+    assert all(sniper.schedule(lecture) for lecture in lectures)
+    # Scheduled twice, sniped once.
+    assert not sniper.schedule(lectures[0])
+    threads = [sniper.thread]
+
+    wait_done(sniper)
+    sniper.stop()
+
+    assert threads == [sniper.thread]
+    assert sorted(campus.registrations) == sorted(lecture.aid for lecture in lectures)
+    assert all(len(times) == 1 for times in campus.registrations.values())
+    assert all(report['offset_ms'] >= 0 for report in sniper.reports)
+
+
+def test_burst_stops_at_a_final_refusal(campus):
+    sniper = make_sniper(campus)
+    lecture = publish(campus, 1.5)
+    campus.full.add(lecture.aid)
+
+    sniper.schedule(lecture)
+    wait_done(sniper)
+    sniper.stop()
+
+    assert [report['result'] for report in sniper.reports] == ['报名人数已满']
@@ -0,0 +1,175 @@
+"""
+A tracer writing spans in the Chrome trace event format, which chrome://tracing and https://ui.perfetto.dev open.
+
+>>> TRACER.start('./trace.json')
+>>> spider.check_lecture()
+>>> TRACER.stop()
+
+Each poll, login and registration is a span, and every request sent by query_html is a span within it.
+The viewers nest the spans of one thread by time. A span begun in another thread, e.g. a page fetched
+or a registration sent by a worker, is tied to the span it was started from by a flow arrow,
+as long as the worker runs in a copy of the context, see CURRENT_SPAN.
+"""
+import os
+import json
+import time
+import functools
+import itertools
+import threading
+from contextvars import ContextVar
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, TextIO, Tuple
+
+# The span being run, as (id, thread id). The workers get it by running in contextvars.copy_context().
+CURRENT_SPAN:ContextVar[Tuple[int, int]] = ContextVar('current_span', default = None)
+
+from loguru import logger
+
+from hooks import HOOKS, RequestHooks, RequestInfo
+
+
+class Tracer(object):
+    '''
+    Record spans as complete ('X') events, appended to the trace file as they end.
+
+    The file is a json array left open, which the trace viewers accept as is,
+    so what is written survives a crash. Tracing costs nothing but a flag check while it is off.
+    '''
+
+    def __init__(self, hooks:RequestHooks = HOOKS):
+        self.hooks = hooks
+        self.file:TextIO = None
+        self.enabled:bool = False
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.ids = itertools.count(1)
+
+    def __repr__(self) -> str:
+        return f'Tracer writing to {self.file.name}' if self.enabled else 'Tracer (off)'
+
+    def start(self, path:str = './trace.json'):
+        """
+        Start writing spans to `path`, which is overwritten.
+        """
+        if self.enabled:
+            self.stop()
+
+        with self.lock:
+            self.file = open(path, 'w', encoding = 'utf-8')
+            self.file.write('[\n')
+            self.origin = time.perf_counter()
+            self.enabled = True
+
+        self.hooks.register('after_response', self.after_response)
+        self.hooks.register('on_error', self.on_error)
+        self.hooks.register('on_retry', self.on_retry)
+
+        logger.info("Tracing to {}".format(os.path.abspath(path)))
+
+    def stop(self):
+        self.hooks.unregister('after_response', self.after_response)
+        self.hooks.unregister('on_error', self.on_error)
+        self.hooks.unregister('on_retry', self.on_retry)
+
+        with self.lock:
+            if not self.enabled:
+                return
+            self.enabled = False
+            self.file.close()
+            self.file = None
+
+    def emit(self, event:Dict[str, Any]):
+        event.setdefault('pid', os.getpid())
+        event.setdefault('tid', threading.get_ident())
+
+        with self.lock:
+            if not self.enabled:
+                return
+            self.file.write(json.dumps(event, ensure_ascii = False, default = str) + ',\n')
+            self.file.flush()
+
+    def record(self, name:str, category:str, begin:float, end:float, **args):
+        """
+        Record a span from `begin` to `end` on the perf_counter clock, as a child of the span of the context.
+        """
+        parent = CURRENT_SPAN.get()
+
+        if parent is not None:
+            args['parent'] = parent[0]
+            if parent[1] != threading.get_ident():
+                self.link(parent, begin)
+
+        self.emit({'name': name,
+                    'cat' : category,
+                    'ph'  : 'X',
+                    'ts'  : (begin - self.origin) * 1e6,
+                    'dur' : (end - begin) * 1e6,
+                    'args': args})
+
+    def link(self, parent:Tuple[int, int], begin:float):
+        """
+        Draw a flow arrow from the span `parent`, running in another thread, to the span beginning at `begin` in this one.
+        """
+        flow_id = next(self.ids)
+        ts = (begin - self.origin) * 1e6
+
+        self.emit({'name': 'spawn', 'cat': 'flow', 'ph': 's', 'id': flow_id, 'ts': ts, 'tid': parent[1]})
+        self.emit({'name': 'spawn', 'cat': 'flow', 'ph': 'f', 'bp': 'e', 'id': flow_id, 'ts': ts})
+
+    @contextmanager
+    def span(self, name:str, category:str = 'spider', **args) -> Iterator[Dict[str, Any]]:
+        """
+        Trace the block as a span. The dict yielded is added to the arguments of the span, to attach results.
+        """
+        if not self.enabled:
+            yield args
+            return
+
+        begin = time.perf_counter()
+        args['id'] = next(self.ids)
+        token = CURRENT_SPAN.set((args['id'], threading.get_ident()))
+
+        try:
+            yield args
+        except BaseException as e:
+            args['error'] = repr(e)
+            raise
+        finally:
+            CURRENT_SPAN.reset(token)
+            self.record(name, category, begin, time.perf_counter(), **args)
+
+    def traced(self, name:str, category:str = 'spider') -> Callable:
+        """
+        A decorator tracing each call of the function as a span.
+        """
+        def decorator(function:Callable) -> Callable:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self.span(name, category):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def after_response(self, info:RequestInfo, response):
+        self.record(f'{info.method} {info.endpoint}', 'http', info.begin, info.begin + info.seconds,
+                    status         = info.status,
+                    request_bytes  = info.request_bytes,
+                    response_bytes = info.response_bytes)
+
+    def on_error(self, info:RequestInfo, error:BaseException):
+        self.record(f'{info.method} {info.endpoint}', 'http', info.begin, info.begin + info.seconds,
+                    error         = repr(error),
+                    request_bytes = info.request_bytes)
+
+    def on_retry(self, info:RequestInfo, error:BaseException):
+        self.emit({'name': f'retry {info.method} {info.endpoint}',
+                    'cat' : 'http',
+                    'ph'  : 'i',
+                    's'   : 't',
+                    'ts'  : (time.perf_counter() - self.origin) * 1e6,
+                    'args': {'attempt': info.attempt, 'error': repr(error)}})
+
+
+TRACER = Tracer()